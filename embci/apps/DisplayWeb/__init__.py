@@ -353,7 +353,7 @@ class WebSocketMulticaster(LoopTaskInThread):
 
     def _data_fetch(self):
         data = process_realtime(reader.data_channel, self.pt)
-        server.multicast(data)
+        server.multicast_frame(data)
         return data
 
     def _data_cache(self):
@@ -12,8 +12,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from embci.processing import SignalInfo
+from embci.processing import SignalInfo, StreamingFilter
 signalinfo = SignalInfo(0)
+streamfilter = StreamingFilter()
 
 from embci.io import SocketTCPServer as Server
 server = Server()
@@ -18,21 +18,22 @@ import bottle
 
 from embci.utils import serialize, deserialize, ensure_bytes, ensure_unicode
 
-from .globalvars import signalinfo, pt
+from .globalvars import signalinfo, streamfilter, pt
 
 
 def process_register(data, pt=pt):
-    signalinfo.notch(data, pt.notch or 50, register=True)
-    low, high = pt.bandpass.get('low', 4), pt.bandpass.get('high', 40)
-    signalinfo.bandpass(data, low, high, register=True)
+    '''Design realtime filter with notch & bandpass params in `pt`.'''
+    if not signalinfo.sample_rate:
+        return
+    notch = 50 if pt.notch is True else pt.notch
+    bandpass = pt.bandpass and (pt.bandpass.low, pt.bandpass.high)
+    # filter state is kept if params are not changed
+    streamfilter.design(signalinfo.sample_rate, notch, bandpass)
 
 
 def process_realtime(data, pt=pt):
-    if pt.notch:
-        data = signalinfo.notch_realtime(data)
-    if pt.bandpass:
-        data = signalinfo.bandpass_realtime(data)
-    return data
+    process_register(data, pt)
+    return streamfilter.process(data)
 
 
 def process_fullarray(data, pt=pt):
@@ -28,6 +28,9 @@ Use them as an individual API module!
     - Connection:
     - Data:
     - Methods:
+- Emulator
+    - Desc: hardware-free ADS1299 / ESP32 models for testing and benchmark
+    - Methods: EmulatedADS1299_API, EmulatedESP32_API, benchmark
 '''
 
 #  from ..utils import config_logger
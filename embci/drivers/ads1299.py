@@ -20,8 +20,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import time
-import struct
 import select
+import contextlib
 try:
     from multiprocessing import Lock
 except ImportError:
@@ -67,6 +67,10 @@ CMD_RDATA       = 0x12  # noqa: E221
 CMD_RREG        = 0x20  # noqa: E221
 CMD_WREG        = 0x40  # noqa: E221
 
+# ADS1299 power-on values of registers 0x00 - 0x17
+REG_DEFAULT = [0x3E, 0x96, 0xC0, 0x60, 0x00] + [0x61] * 8 + [0x00] * 7 + \
+              [0x0F, 0x00, 0x00, 0x00]
+
 # ADS1299 Sample data rate dict, set REG_CONFIG1 to this value
 SAMPLE_RATE = {
     250:        0b110,
@@ -111,13 +115,19 @@ class ADS1299_API(spidev.SpiDev):
     open              -- Open device
     start             -- Start Read DATA Continuously, must `open` first
     close             -- Close device
-    read              -- Return parsed np.ndarray data with shape of (8,)
+    read              -- Return parsed np.ndarray data with shape of (m,)
+    read_chunk        -- Return parsed data of several samples (m, n)
     read_raw          -- Return raw 8-channel * 3 = 24 bytes data
     write             -- Send bytes array to ADS1299
     write_register    -- Write one register with index and value
     write_registers   -- Write multiple registers with start index and values
+    read_register     -- Read one register from shadow copy or from chip
+    read_registers    -- Read multiple registers from shadow copy or from chip
+    update_registers  -- Write changed registers in one SDATAC...RDATAC window
     measure_impedance -- Property, set it to True or False
     enable_bias       -- Property, set it to True or False
+    channel_mask      -- Property, whether each of 8 channels is enabled
+    set_channel       -- Enable or power down one channel
     set_sample_rate   -- Rate can be 250 | 500 | 1k | 2k | 4k | 8k | 16k Hz
     set_input_source  -- Choose one source from available:
         normal:  Normal electrode input
@@ -142,6 +152,21 @@ class ADS1299_API(spidev.SpiDev):
     >>> ads.read()
     array([1.234, ...])  # this will return impedance value of each channel
 
+    A shadow copy of registers is maintained, so reading registers doesn't
+    interrupt data streaming. Settings changed before `start` are kept in
+    shadow copy and applied when chip starts.
+    >>> ads = ADS1299_API()
+    >>> ads.set_input_source('test')
+    >>> ads.open((0, 0))
+    >>> ads.start(500)  # stream test signal
+
+    Powered down channels are still transferred in the 27-byte SPI frame,
+    but they are dropped before decoding, i.e. `read` and `read_chunk`
+    only return data of m enabled channels.
+    >>> ads.set_channel(7, False)
+    >>> ads.read()[0].shape
+    (7,)
+
     Attention
     ---------
     Ads1299 accept data from DIN at raising edge and transfer data out from
@@ -170,10 +195,12 @@ class ADS1299_API(spidev.SpiDev):
     |                                  | fileno                            |
     +----------------------------------+-----------------------------------+
     '''
+    # GPIO class of DRDY pin, see `embci.drivers.emulator` for an emulated one
+    GPIO = SysfsGPIO
 
     def __init__(self, scale=4.5/24/2**24, *a, **k):
         self.scale = float(scale)
-        self._DRDY = SysfsGPIO(PIN_DRDY)
+        self._DRDY = self.GPIO(PIN_DRDY)
         # self._PWRDN = SysfsGPIO(PIN_PWRDN)
         # self._RESET = SysfsGPIO(PIN_RESET)
         # self._START = SysfsGPIO(PIN_START)
@@ -181,6 +208,10 @@ class ADS1299_API(spidev.SpiDev):
         self._lock = Lock()
         self._opened = False
         self._start_time = 0
+        self._rdatac = False
+        self._regs = list(REG_DEFAULT)
+        self._configured = set()  # registers set by user, applied in start
+        self._update_channels()
         self._enable_bias = False
         self._measure_impedance = False
 
@@ -239,17 +270,25 @@ class ADS1299_API(spidev.SpiDev):
         #  Chip wakes up at RDATAC mode. Send SDATAC then config registers.
         self.write(CMD_SDATAC)
 
-        # Configure ADS1299 registers
-        self.write_register(REG_CONFIG1, 0b10010000 | SAMPLE_RATE[sample_rate])
-        self.write_register(REG_CONFIG2, 0b11010000)
-        self.write_register(REG_CONFIG3, 0b11100000)
-        self.write_register(REG_MISC, 0b00100000)
-        self.write_registers(REG_CHnSET_BASE, [0b01100000] * 8)
+        # Configure ADS1299 registers, keep settings made by user even if
+        # they equal to power-on defaults (e.g. input source `shorted`)
+        config = {
+            REG_CONFIG2: 0b11010000,
+            REG_CONFIG3: 0b11100000,
+            REG_MISC: 0b00100000,
+        }
+        config.update({REG_CHnSET_BASE + ch: 0b01100000 for ch in range(8)})
+        config.update({reg: self._regs[reg] for reg in self._configured})
+        config[REG_CONFIG1] = 0b10010000 | SAMPLE_RATE[sample_rate]
+        self._regs = list(REG_DEFAULT)
+        self._write_changes(config)
+        self._update_channels()
         self.write(CMD_START)  # same as self._START.value = 1
         time.sleep(1)
 
         # Start streaming data
         self.write(CMD_RDATAC)
+        self._rdatac = True
         self._start_time = time.time()
 
     def close(self):
@@ -259,6 +298,7 @@ class ADS1299_API(spidev.SpiDev):
         self.write(CMD_STOP)
         super(ADS1299_API, self).close()
         self._start_time = 0
+        self._rdatac = False
         self._epoll.unregister(self._DRDY)
         self._DRDY.export = False
         # self._START.export = False
@@ -266,77 +306,86 @@ class ADS1299_API(spidev.SpiDev):
         # self._RESET.export = False
         self._opened = False
 
-    @ensure_start
     def set_sample_rate(self, rate):
         if rate not in SAMPLE_RATE:
             print('[ADS1299 API] choose one from supported rate!')
             print(' | '.join(list(SAMPLE_RATE.keys())))
             return
         rate = SAMPLE_RATE[rate]
-        self.write(CMD_SDATAC)
         v = self.read_register(REG_CONFIG1)
-        self.write_register(REG_CONFIG1, v & ~0b111 | rate)
-        self.write(CMD_RDATAC)
+        self.update_registers({REG_CONFIG1: v & ~0b111 | rate})
         return rate
 
-    @ensure_start
     def set_input_source(self, src):
         if src not in INPUT_SOURCES:
             print('[ADS1299 API] choose one from supported source!')
             print(' | '.join(list(INPUT_SOURCES.keys())))
             return
         src = INPUT_SOURCES[src]
-        self.write(CMD_SDATAC)
         vs = self.read_registers(REG_CHnSET_BASE, 8)
-        vs = [(v & ~0b111 | src) for v in vs]
-        self.write_registers(REG_CHnSET_BASE, vs)
-        self.write(CMD_RDATAC)
+        self.update_registers({
+            REG_CHnSET_BASE + ch: v & ~0b111 | src for ch, v in enumerate(vs)
+        })
         return src
 
-    @ensure_start
     def set_channel(self, ch, en=True):
-        if ch < 0 or ch > 8:
+        if not 0 <= ch < 8:
             return
-        raise NotImplementedError
-        # TODO: drivers.ads1299 set channel enable/disable
+        reg = REG_CHnSET_BASE + ch
+        v = self.read_register(reg)
+        # bit 7 of CHnSET: power-down
+        self.update_registers({reg: v & 0x7F if en else v | 0x80})
+        self._update_channels()
+        return en
+
+    @property
+    def channel_mask(self):
+        '''Whether each channel is enabled (not powered down).'''
+        regs = self._regs[REG_CHnSET_BASE:REG_CHnSET_BASE + 8]
+        return [not v >> 7 for v in regs]
+
+    def _update_channels(self):
+        '''Cache indices of enabled channels and their bytes in a frame.'''
+        self._channels = np.flatnonzero(self.channel_mask)
+        self._channel_bytes = (
+            3 * self._channels[:, None] + np.arange(3)).ravel()
 
     @property
     def enable_bias(self):
         return self._enable_bias
 
     @enable_bias.setter
-    @ensure_start
     def enable_bias(self, boolean):
-        self.write(CMD_SDATAC)
         if boolean is True:
-            self.write_register(REG_BIAS_SENSP, 0b11111111)
-            self.write_register(REG_BIAS_SENSN, 0b11111111)
-            self.write_register(REG_CONFIG3, 0b11101100)
+            self.update_registers({
+                REG_BIAS_SENSP: 0b11111111,
+                REG_BIAS_SENSN: 0b11111111,
+                REG_CONFIG3: 0b11101100,
+            })
         elif boolean is False:
-            self.write_register(REG_BIAS_SENSP, 0b00000000)
-            self.write_register(REG_BIAS_SENSN, 0b00000000)
-            self.write_register(REG_CONFIG3, 0b11100000)
+            self.update_registers({
+                REG_BIAS_SENSP: 0b00000000,
+                REG_BIAS_SENSN: 0b00000000,
+                REG_CONFIG3: 0b11100000,
+            })
         self._enable_bias = boolean
-        self.write(CMD_RDATAC)
 
     @property
     def measure_impedance(self):
         return self._measure_impedance
 
     @measure_impedance.setter
-    @ensure_start
     def measure_impedance(self, boolean):
-        self.write(CMD_SDATAC)
-        vs = self.read_registers(REG_CHnSET_BASE, 8)
-        vs = [v & ~(0b111 << 4) for v in vs]
-        if boolean is True:
-            self.write_register(REG_LOFF_SENSP, 0b11111111)
-            self.write_registers(REG_CHnSET_BASE, vs)
-        elif boolean is False:
-            self.write_register(REG_LOFF_SENSP, 0b00000000)
-            self.write_registers(REG_CHnSET_BASE, [v | 0b110 << 4 for v in vs])
+        if boolean is True or boolean is False:
+            gain = 0b000 if boolean else 0b110  # PGA gain 1 or 24
+            vs = self.read_registers(REG_CHnSET_BASE, 8)
+            config = {
+                REG_CHnSET_BASE + ch: v & ~(0b111 << 4) | gain << 4
+                for ch, v in enumerate(vs)
+            }
+            config[REG_LOFF_SENSP] = 0b11111111 if boolean else 0b00000000
+            self.update_registers(config)
         self._measure_impedance = boolean
-        self.write(CMD_RDATAC)
 
     @ensure_start
     def read(self, *args, **kwargs):
@@ -353,20 +402,39 @@ class ADS1299_API(spidev.SpiDev):
         #  Rev.3
         self._epoll.poll()  # this will block until interrupt on DRDY detected
 
-        num = self.write([0x00] * 27)[3:]
-        byte = ''
-        for i in range(8):
-            # tmp = chr(num[3 * i + 2]) + chr(num[3 * i + 1]) + chr(num[3 * i])
-            # use time: 4.3us
-            tmp = struct.pack('3B', num[3 * i + 2], num[3 * i + 1], num[3 * i])
-            # use time: 1.3us
-            byte += tmp + ('\xff' if num[3 * i] > 127 else '\x00')
-        data = np.frombuffer(byte, np.int32)
+        # 3 bytes status + 8 channels * 3 bytes data
+        raw = np.array(self.write([0x00] * 27)[3:], np.uint8)
+        data = decode_int24(raw[self._channel_bytes])
         return data * self.scale, time.time() - self._start_time
 
+    @ensure_start
+    def read_chunk(self, num=8, timeout=1, *args, **kwargs):
+        '''
+        Drain at most `num` DRDY frames and decode them at once. Stop early
+        if DRDY is not asserted in `timeout` seconds.
+
+        Returns
+        -------
+        data : ndarray
+            Array with a shape of m x n, m is number of enabled channels
+        ts : ndarray
+            Timestamps of each sample with a shape of (n,)
+        '''
+        frames, ts = [], []
+        for i in range(num):
+            if not self._epoll.poll(timeout):
+                break
+            ts.append(time.time() - self._start_time)
+            frames.extend(self.write([0x00] * 27))
+        frames = np.array(frames, np.uint8).reshape(-1, 27)[:, 3:]
+        frames = frames[:, self._channel_bytes]
+        return (decode_int24(frames) * self.scale).T, np.array(ts)
+
     def write(self, byte_array):
         '''Write bytes array to ADS1299 through SPI and return value list.'''
-        if not isinstance(byte_array, list):
+        if isinstance(byte_array, int):  # single command
+            byte_array = [byte_array]
+        elif not isinstance(byte_array, list):
             byte_array = list(byte_array)
         with self._lock:
             value = self.xfer2(byte_array)
@@ -375,26 +443,83 @@ class ADS1299_API(spidev.SpiDev):
     def write_register(self, reg, byte):
         '''Write register `reg` with value `byte`'''
         self.write([reg | CMD_WREG, 0x00, byte])
+        self._regs[reg] = byte
 
     def write_registers(self, reg, byte_array):
         '''Write registers start from `reg` with values `byte_array`'''
+        byte_array = list(byte_array)
         self.write([reg | CMD_WREG, len(byte_array) - 1] + byte_array)
+        self._regs[reg:reg + len(byte_array)] = byte_array
 
-    @ensure_start
-    def read_register(self, reg):
+    def read_register(self, reg, cached=True):
         '''Read single register at `reg`'''
-        self.write(CMD_SDATAC)
-        value = self.write([CMD_RREG | reg, 0x00, 0x00])[2]
-        self.write(CMD_RDATAC)
-        return value
+        return self.read_registers(reg, 1, cached)[0]
 
-    @ensure_start
-    def read_registers(self, reg, num):
-        '''Read `num` registers start from `reg`'''
+    def read_registers(self, reg, num, cached=True):
+        '''
+        Read `num` registers start from `reg`. Values are returned from
+        shadow copy by default. Set `cached` to False to read from chip,
+        e.g. lead-off status registers LOFF_STATP & LOFF_STATN.
+        '''
+        if not cached:
+            assert self._opened, 'you need to open a spi device first'
+            with self._sdatac():
+                value = self.write([CMD_RREG | reg, num - 1] + [0] * num)[2:]
+            self._regs[reg:reg + num] = value
+        return self._regs[reg:reg + num]
+
+    def update_registers(self, config):
+        '''
+        Write registers in dict `config` ({reg: value}) whose values differ
+        from shadow copy. Registers are written in contiguous bursts within
+        one SDATAC ... RDATAC window. If chip is not started yet, only the
+        shadow copy is updated and it will be applied in `start`.
+        '''
+        self._configured.update(config)
+        if not self._start_time:
+            for reg, v in config.items():
+                self._regs[reg] = v
+            return
+        with self._sdatac():
+            self._write_changes(config)
+
+    def _write_changes(self, config):
+        regs = sorted(reg for reg, v in config.items() if self._regs[reg] != v)
+        while regs:
+            n = 1
+            while n < len(regs) and regs[n] == regs[0] + n:
+                n += 1
+            self.write_registers(regs[0], [config[reg] for reg in regs[:n]])
+            regs = regs[n:]
+
+    @contextlib.contextmanager
+    def _sdatac(self):
+        '''Stop data continuous mode to access registers, nested safe.'''
+        if not self._rdatac:
+            yield
+            return
         self.write(CMD_SDATAC)
-        value = self.write([CMD_RREG | reg, num - 1] + [0] * num)[2:]
-        self.write(CMD_RDATAC)
-        return value
+        self._rdatac = False
+        try:
+            yield
+        finally:
+            self.write(CMD_RDATAC)
+            self._rdatac = True
+
+
+def decode_int24(raw):
+    '''
+    Decode big-endian 24-bit two's complement integers, e.g. channel data of
+    ADS1299. `raw` is bytes, list of int or uint8 array whose last dimension
+    is a multiple of 3. Return int32 array with a shape of
+    (..., raw.shape[-1] // 3).
+    '''
+    if isinstance(raw, (bytes, bytearray)):
+        raw = np.frombuffer(raw, np.uint8)
+    raw = np.asarray(raw, np.uint8)
+    b = raw.reshape(raw.shape[:-1] + (-1, 3)).astype(np.int32)
+    # shift the sign bit to bit 31, then arithmetic right shift extends it
+    return (b[..., 0] << 24 | b[..., 1] << 16 | b[..., 2] << 8) >> 8
 
 
 def voltage_to_celsius(raw):
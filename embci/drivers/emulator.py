@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# coding=utf-8
+#
+# File: EmBCI/embci/drivers/emulator.py
+
+'''
+SPI Device Emulator
+-------------------
+Hardware-free emulation of ADS1299 chip and EmBCI on-board ESP32, so that
+drivers and readers can be exercised and benchmarked on a plain Linux box.
+
+- DRDYEmulator: data ready pin backed by an eventfd (or pipe), which is
+  signaled at sample rate by a background thread.
+- ADS1299Chip: register-level model of ADS1299. Commands are parsed from SPI
+  transfers and channel data are synthesized according to registers.
+- ESP32Chip: model of ESP32 firmware which buffers batches of samples.
+- EmulatedADS1299_API / EmulatedESP32_API: drop-in replacement of
+  `ADS1299_API` and `ESP32_API` that talk to chip models instead of
+  `/dev/spidev*` and `/sys/class/gpio`.
+
+Examples
+--------
+>>> api = EmulatedADS1299_API()
+>>> api.open((0, 0))
+>>> api.start(500)
+>>> api.read_register(0x00)  # chip ID
+62
+>>> api.read_chunk(10)[0].shape
+(8, 10)
+
+Readers accept API class as an argument:
+>>> reader = ESP32SPIReader(500, 2, 8, API=EmulatedESP32_API)
+>>> reader.start((0, 0))
+
+Measure max sustainable sample rate and CPU time per sample:
+>>> benchmark(EmulatedESP32_API, ESP32SPIReader)
+
+Or from command line:
+    python -m embci.drivers.emulator
+'''
+
+# built-in
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import os
+import time
+import fcntl
+import select
+import threading
+try:
+    from time import process_time
+except ImportError:  # python 2
+    from time import clock as process_time
+
+# requirements.txt: data: numpy
+import numpy as np
+
+from .ads1299 import (
+    ADS1299_API, PIN_DRDY, SAMPLE_RATE, REG_DEFAULT, REG_CONFIG1,
+    REG_CHnSET_BASE,
+    CMD_WAKEUP, CMD_STANDBY, CMD_RESET, CMD_START, CMD_STOP,
+    CMD_RDATAC, CMD_SDATAC, CMD_RDATA, CMD_RREG, CMD_WREG,
+)
+from .esp32 import ESP32_API, WREG, REG_SR, REG_IS, REG_CH
+
+__all__ = [
+    'DRDYEmulator', 'ADS1299Chip', 'ESP32Chip',
+    'EmulatedADS1299_API', 'EmulatedESP32_API', 'benchmark',
+]
+
+
+# =============================================================================
+# Data ready pin
+
+class DRDYEmulator(object):
+    '''
+    Emulated data ready pin. A falling edge is an event on `fileno()`, which
+    is signaled by a background thread at `rate` Hz while exported. It can
+    be polled by `select` like a GPIO interrupt, and it also works as an
+    edge-triggered `select.epoll` object that only watches itself.
+
+    Edges come on time no matter how fast they are consumed. Total number
+    of edges is counted by `edges`.
+    '''
+    def __init__(self, pin=PIN_DRDY, rate=0):
+        self.pin = pin
+        self.direction = 'in'
+        self.edge = 'falling'
+        self.value = 1
+        self.edges = 0
+        self._rate = float(rate)
+        self._lock = threading.Lock()
+        self._flag_stop = threading.Event()
+        self._flag_wake = threading.Event()
+        self._thread = None
+        if hasattr(os, 'eventfd'):
+            self._rfd = self._wfd = os.eventfd(0, os.EFD_NONBLOCK)
+        else:
+            self._rfd, self._wfd = os.pipe()
+            flags = fcntl.fcntl(self._rfd, fcntl.F_GETFL)
+            fcntl.fcntl(self._rfd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def __repr__(self):
+        return '<DRDY emulator {:.1f}Hz, {} edges at 0x{:x}>'.format(
+            self._rate, self.edges, id(self))
+
+    def fileno(self):
+        return self._rfd
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        with self._lock:
+            self._anchor = (time.time(), self.edges)
+            self._rate = float(value)
+        self._flag_wake.set()
+
+    @property
+    def export(self):
+        return self._thread is not None
+
+    @export.setter
+    def export(self, value):
+        if value and self._thread is None:
+            self.rate = self._rate
+            self._flag_stop.clear()
+            self._thread = threading.Thread(target=self._signal)
+            self._thread.daemon = True
+            self._thread.start()
+        elif not value and self._thread is not None:
+            self._flag_stop.set()
+            self._flag_wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def _signal(self):
+        while not self._flag_stop.is_set():
+            with self._lock:
+                (t0, e0), rate = self._anchor, self._rate
+                if rate > 0:
+                    n = e0 + int((time.time() - t0) * rate) - self.edges
+                    if n > 0:
+                        self.edges += n
+                        os.write(self._wfd, np.uint64(n).tobytes())
+            # sleep until next edge or rate changed
+            delay = 0.1
+            if rate > 0:
+                delay = t0 + (self.edges - e0 + 1) / rate - time.time()
+            self._flag_wake.wait(min(max(delay, 0), 0.1))
+            self._flag_wake.clear()
+
+    # epoll-like interface used by ADS1299_API
+    def register(self, *a, **k):
+        pass
+
+    def unregister(self, *a, **k):
+        pass
+
+    def poll(self, timeout=-1, *a, **k):
+        '''Block until next edge. Edges before last poll are merged.'''
+        if timeout is not None and timeout < 0:
+            timeout = None
+        if not select.select([self._rfd], [], [], timeout)[0]:
+            return []
+        try:
+            os.read(self._rfd, 4096)
+        except OSError:
+            pass
+        return [(self._rfd, select.EPOLLIN)]
+
+    def close(self):
+        self.export = False
+        os.close(self._rfd)
+        if self._wfd != self._rfd:
+            os.close(self._wfd)
+
+
+# =============================================================================
+# Chip models
+
+class ADS1299Chip(object):
+    '''
+    Register-level model of ADS1299. Commands and register read / write are
+    parsed from SPI transfers. Channel data are synthesized according to
+    CONFIG1 (sample rate) and CHnSET (power down, gain and input source).
+    Like the real chip, registers can only be accessed in SDATAC mode and
+    unread samples are overwritten by new ones.
+
+    Attributes
+    ----------
+    samples_read : int
+        Number of samples transferred out of chip.
+    samples_dropped : int
+        Number of samples overwritten before being read.
+    commands_ignored : int
+        Number of register access in RDATAC mode.
+    '''
+    GAINS = np.array([1, 2, 4, 6, 8, 12, 24, 24])
+    VREF = 4.5
+
+    def __init__(self, drdy, batch=1, seed=None):
+        self.drdy = drdy
+        self.batch = batch
+        self._random = np.random.RandomState(seed)
+        self.reset()
+
+    def reset(self):
+        self.regs = list(REG_DEFAULT)
+        self.rdatac = True
+        self.running = False
+        self.samples_read = self.samples_dropped = self.commands_ignored = 0
+        self._end = self.drdy.edges * self.batch  # next sample to read
+        self._update()
+
+    @property
+    def sample_rate(self):
+        return 16000 >> (self.regs[REG_CONFIG1] & 0b111)
+
+    def _update(self):
+        '''Samples are only converted after START command.'''
+        self.drdy.rate = self.sample_rate / self.batch if self.running else 0
+
+    def synthesize(self, index):
+        '''Return int32 codes of samples at `index` with shape of n x 8.'''
+        t = np.reshape(index, (-1, 1)) / float(self.sample_rate)
+        chset = np.array(self.regs[REG_CHnSET_BASE:REG_CHnSET_BASE + 8])
+        mux, gain = chset & 0b111, self.GAINS[(chset >> 4) & 0b111]
+        noise = self._random.randn(len(t), 8) * 1e-6
+        volt = np.select([
+            mux == 0b000,     # normal: alpha wave of each channel + 50Hz
+            mux == 0b001,     # shorted: noise only
+            mux == 0b011,     # mvdd: supply measurement
+            mux == 0b100,     # temperature: 145.3mV at 25 Celsius
+            mux == 0b101,     # test signal: 1Hz square wave
+        ], [
+            20e-6 * np.sin(2 * np.pi * (8 + np.arange(8)) * t) +
+            10e-6 * np.sin(2 * np.pi * 50 * t) + noise,
+            noise,
+            np.full_like(noise, 1.25),
+            np.full_like(noise, 145.3e-3),
+            np.where(t % 1 < 0.5, 1.875e-3, -1.875e-3) + noise,
+        ], 0)
+        volt[:, chset >> 7 == 1] = 0  # channel power down
+        code = np.round(volt * gain / self.VREF * 2**23)
+        return np.clip(code, -2**23, 2**23 - 1).astype(np.int32)
+
+    def samples(self, n):
+        '''Pop latest `n` converted samples as int32 codes.'''
+        end = self.drdy.edges * self.batch
+        start = end - n
+        if start > self._end:
+            self.samples_dropped += start - self._end
+        self._end = end
+        self.samples_read += n
+        return self.synthesize(np.arange(start, end))
+
+    def frame(self):
+        '''Status word and one sample of 8 channels in 24-bit big-endian.'''
+        data = self.samples(1).astype('>i4').view(np.uint8)
+        return [0xC0, 0x00, 0x00] + data.reshape(-1, 4)[:, 1:].ravel().tolist()
+
+    def transfer(self, values):
+        '''Handle an SPI transfer and return bytes clocked out of DOUT.'''
+        values = list(values)
+        out = [0] * len(values)
+        if values and not values[0] and self.rdatac and self.running:
+            return (self.frame() + out)[:len(out)]
+        i = 0
+        while i < len(values):
+            op = values[i]
+            if op & 0xE0 in (CMD_RREG, CMD_WREG):
+                reg, num = op & 0x1F, values[i + 1] + 1
+                if self.rdatac:
+                    self.commands_ignored += 1
+                elif op & 0xE0 == CMD_RREG:
+                    out[i + 2:i + 2 + num] = self.regs[reg:reg + num]
+                else:
+                    for r, v in enumerate(values[i + 2:i + 2 + num], reg):
+                        if 0 < r < len(self.regs):  # ID is read-only
+                            self.regs[r] = v
+                    self._update()
+                i += 2 + num
+                continue
+            if op == CMD_RESET:
+                self.reset()
+            elif op == CMD_START:
+                self.running = True
+                self._update()
+            elif op == CMD_STOP:
+                self.running = False
+                self._update()
+            elif op == CMD_RDATAC:
+                self.rdatac = True
+            elif op == CMD_SDATAC:
+                self.rdatac = False
+            elif op == CMD_RDATA and self.running:
+                frame = self.frame()
+                out[i + 1:i + 1 + len(frame)] = frame
+                out = out[:len(values)]
+                i += len(frame)
+            elif op not in (0x00, CMD_WAKEUP, CMD_STANDBY):
+                self.commands_ignored += 1
+            i += 1
+        return out
+
+
+class ESP32Chip(ADS1299Chip):
+    '''
+    Model of EmBCI ESP32 firmware, which reads ADS1299 continuously and
+    buffers `batch` samples. DRDY is asserted when a batch is ready. Each
+    transfer starts with 4 bytes command followed by int32 samples.
+    '''
+    def __init__(self, drdy, batch=32, seed=None):
+        super(ESP32Chip, self).__init__(drdy, batch, seed)
+        self.rdatac = self.running = False
+        self.regs[REG_CONFIG1] = 0x90 | SAMPLE_RATE[500]
+        self.running = True
+        self._update()
+
+    def transfer(self, values):
+        values = list(values)
+        if values and values[0] == WREG:  # command to virtual registers
+            reg, args = values[1], values[2:4]
+            if reg == REG_SR:
+                self.regs[REG_CONFIG1] = 0x90 | args[0]
+                self._update()
+            elif reg == REG_IS:
+                base = REG_CHnSET_BASE
+                self.regs[base:base + 8] = [
+                    v & ~0b111 | args[0] for v in self.regs[base:base + 8]]
+            elif reg == REG_CH and 0 <= args[0] < 8:
+                r = REG_CHnSET_BASE + args[0]
+                self.regs[r] = self.regs[r] & 0x7F | (not args[1]) << 7
+            return [0] * len(values)
+        data = self.samples(len(values) // 32).astype('<i4')
+        return list(bytearray(data.tobytes()))
+
+
+# =============================================================================
+# Emulated APIs
+
+class _EmulatedSPIMixin(object):
+    '''Replace spidev and sysfs GPIO with a chip model and DRDY emulator.'''
+    GPIO = DRDYEmulator
+    CHIP = ADS1299Chip
+
+    def open(self, dev, *a, **k):
+        assert not self._opened, 'already used spidev{}.{}'.format(*self._dev)
+        self._dev = tuple(dev)
+        self._chip = self.CHIP(self._DRDY, getattr(self, 'n_batch', 1))
+        self._DRDY.export = True
+        self._epoll = self._DRDY
+        self._opened = True
+
+    def xfer2(self, values, *a, **k):
+        return self._chip.transfer(values)
+
+    xfer = xfer2
+
+
+class EmulatedADS1299_API(_EmulatedSPIMixin, ADS1299_API):
+    pass
+
+
+class EmulatedESP32_API(_EmulatedSPIMixin, ESP32_API):
+    CHIP = ESP32Chip
+
+
+# =============================================================================
+# Benchmark
+
+def benchmark(API=EmulatedESP32_API, reader=None, duration=3,
+              sample_rates=sorted(SAMPLE_RATE), verbose=True):
+    '''
+    Stream emulated data at each sample rate and measure samples lost and
+    CPU time per sample. CPU time of the whole process is counted, which
+    includes the DRDY emulator thread.
+
+    Parameters
+    ----------
+    API : class
+        Emulated API, default `EmulatedESP32_API`.
+    reader : class, optional
+        Reader class like `embci.io.ESP32SPIReader`, which will run in a
+        thread of this process. Drive API directly by `read_chunk` if not
+        provided.
+    duration : float
+        Seconds to stream at each sample rate.
+
+    Returns
+    -------
+    results : list of dict
+        Keys are `sample_rate`, `received` (samples per second), `lost`
+        (ratio of dropped samples) and `cpu` (CPU seconds per sample).
+    '''
+    results = []
+    for rate in sample_rates:
+        if reader is None:
+            api = API()
+            api.open((0, 0))
+            api.start(rate)
+            chip, num = api._chip, max(1, rate // 50)
+        else:
+            obj = reader(rate, duration, 8, API=API)
+            obj.start((0, 0), method='thread')
+            chip = obj._api._chip
+        # samples converted during chip startup are not counted as lost
+        while not chip.samples_read:
+            api.read_chunk(num) if reader is None else time.sleep(0.01)
+        seq0, drop0 = chip.samples_read, chip.samples_dropped
+        cpu0, time0 = process_time(), time.time()
+        if reader is None:
+            while time.time() - time0 < duration:
+                api.read_chunk(num)
+        else:
+            time.sleep(duration)
+        cpu, elapsed = process_time() - cpu0, time.time() - time0
+        read = chip.samples_read - seq0
+        drop = chip.samples_dropped - drop0
+        if reader is None:
+            api.close()
+        else:
+            obj.close()
+            type(obj).remove(reader)  # readers of SPI are singletons
+        chip.drdy.close()
+        results.append({
+            'sample_rate': rate,
+            'received': read / elapsed,
+            'lost': drop / float(max(read + drop, 1)),
+            'cpu': cpu / max(read, 1),
+        })
+        if verbose:
+            print('{sample_rate:6d}Hz  received {received:9.1f}/s  lost '
+                  '{lost:6.2%}  CPU {0:7.1f}us/sample'.format(
+                      results[-1]['cpu'] * 1e6, **results[-1]))
+    if verbose:
+        ok = [r['sample_rate'] for r in results if r['lost'] < 0.01]
+        print('Max sustainable sample rate: {}Hz'.format(
+            max(ok) if ok else None))
+    return results
+
+
+if __name__ == '__main__':
+    from embci.io import ESP32SPIReader, ADS1299SPIReader
+    print('ESP32_API:')
+    benchmark(EmulatedESP32_API)
+    print('ESP32SPIReader:')
+    benchmark(EmulatedESP32_API, ESP32SPIReader)
+    print('ADS1299_API:')
+    benchmark(EmulatedADS1299_API)
+    print('ADS1299SPIReader:')
+    benchmark(EmulatedADS1299_API, ADS1299SPIReader)
+
+
+# THE END
@@ -12,13 +12,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import time
-import struct
 from multiprocessing import Queue
 
 # requirements.txt: data: numpy
 import numpy as np
 
-from .ads1299 import ADS1299_API, ensure_start, SAMPLE_RATE, INPUT_SOURCES
+from .ads1299 import (
+    ADS1299_API, ensure_start, SAMPLE_RATE, INPUT_SOURCES, REG_CHnSET_BASE)
 
 # =============================================================================
 # ESP32 Pin mapping
@@ -60,9 +60,11 @@ class ESP32_API(ADS1299_API):
         # [cmd cmd cmd cmd 0x00 0x00 0x00 0x00 ... 0x00]
         self.n_batch = n_batch
         self._tosend = 4 * 8 * self.n_batch * [0x00]
-        self._data_format = '%dB' % len(self._tosend)
         self._cmd_queue = Queue()
-        self._data_buffer = []
+        # Decoded batch and timestamps, samples before cursor are consumed
+        self._data_buffer = np.zeros((0, 8))
+        self._data_ts = np.zeros(0)
+        self._data_cursor = 0
         super(ESP32_API, self).__init__(scale)
         self._last_time = time.time()
 
@@ -85,44 +87,65 @@ class ESP32_API(ADS1299_API):
     def close(self):
         if not self._opened:
             return
-        self._data_buffer = []
+        self._data_cursor = len(self._data_buffer)
         super(ADS1299_API, self).close()
         self._start_time = 0
         self._epoll.unregister(self._DRDY)
         self._DRDY.export = False
         self._opened = False
 
-    @ensure_start
-    def read(self, timeout=1, *args, **kwargs):
+    def _transfer(self):
+        '''
+        Send pending command or fetch a new batch of samples. Return False
+        if a command is sent, in which case the received data are invalid.
+        '''
         if not self._cmd_queue.empty():
             cmd = self._cmd_queue.get()
             self.write(cmd + self._tosend[len(cmd):])
-            self._data_buffer = []
-            return np.zeros(8, np.float32), self._last_time - self._start_time
-
-        if not len(self._data_buffer):
-            # spidev lib is written in C language, where value of list will be
-            # changed in-situ. Because we want self._tosend keep as [0x00] * n,
-            # self._tosend cannot be directly used in self.xfer[2]. Here we
-            # send a new list created by slicing self._tosend.
-            data = struct.pack(self._data_format, *self.write(self._tosend[:]))
-            data = np.frombuffer(data, np.int32).reshape(self.n_batch, 8)
-            self._data_buffer = list(data * self.scale)
-
-        ts = time.time()
-        while (time.time() - ts) < timeout:
-            dt = time.time() - self._last_time
-            if dt < (0.5 / self._sample_rate):
-                time.sleep(0.4 / self._sample_rate)
-            elif dt < (0.9 / self._sample_rate):
-                time.sleep(0)
-            elif dt > (1.1 / self._sample_rate):
-                self._last_time = time.time()
-                break
-            else:
-                self._last_time += 1.0 / self._sample_rate
-                break
-        return self._data_buffer.pop(0), self._last_time - self._start_time
+            self._data_cursor = len(self._data_buffer)
+            return False
+        # spidev lib is written in C language, where value of list will be
+        # changed in-situ. Because we want self._tosend keep as [0x00] * n,
+        # self._tosend cannot be directly used in self.xfer[2]. Here we
+        # send a new list created by slicing self._tosend.
+        data = np.array(self.write(self._tosend[:]), np.uint8).view(np.int32)
+        data = data.reshape(self.n_batch, 8)[:, self._channels]
+        self._data_buffer = data * self.scale
+        self._last_time = time.time()
+        # samples are evenly spaced and the last one is the freshest
+        self._data_ts = np.arange(1 - self.n_batch, 1) / float(
+            self._sample_rate) + (self._last_time - self._start_time)
+        self._data_cursor = 0
+        return True
+
+    @ensure_start
+    def read(self, *args, **kwargs):
+        '''Return one sample from current batch, fetch a new one if empty.'''
+        if self._data_cursor >= len(self._data_buffer):
+            if not self._transfer():
+                return (np.zeros(len(self._channels)),
+                        self._last_time - self._start_time)
+        i, self._data_cursor = self._data_cursor, self._data_cursor + 1
+        return self._data_buffer[i], self._data_ts[i]
+
+    @ensure_start
+    def read_chunk(self, *args, **kwargs):
+        '''
+        Return samples left in current batch, or fetch a whole new batch in
+        one SPI transfer.
+
+        Returns
+        -------
+        data : ndarray
+            Array with a shape of m x n, m is number of enabled channels
+        ts : ndarray
+            Timestamps of samples derived from sample rate and transfer time
+        '''
+        if self._data_cursor >= len(self._data_buffer):
+            if not self._transfer():
+                return np.zeros((len(self._channels), 0)), np.zeros(0)
+        i, self._data_cursor = self._data_cursor, len(self._data_buffer)
+        return self._data_buffer[i:].T, self._data_ts[i:]
 
     @ensure_start
     def write(self, byte_array):
@@ -175,9 +198,14 @@ class ESP32_API(ADS1299_API):
         return src
 
     def set_channel(self, ch, en=True):
-        if ch < 0 or ch > 8:
+        if not 0 <= ch < 8:
             return
         self.write_registers(REG_CH, [ch, 1 if en else 0])
+        # ESP32 keeps sending 8 channels, disabled ones are dropped here
+        reg = REG_CHnSET_BASE + ch
+        v = self._regs[reg]
+        self._regs[reg] = v & 0x7F if en else v | 0x80
+        self._update_channels()
         return en
 
     @property
@@ -17,6 +17,7 @@ from __future__ import print_function
 import os
 import time
 import threading
+from collections import OrderedDict
 
 # requirements.txt: necessary: pillow
 # requirements.txt: data: numpy
@@ -29,8 +30,8 @@ from gpio4 import SysfsGPIO
 __all__ = [
     'rgb888to565', 'rgb888to565_pro',
     'rgb565to888', 'rgb565to888_pro',
-    'rgb24to565', 'rgb565to24',
-    'ILI9341_API',
+    'rgb24to565', 'rgb565to24', 'rgb888to565_array',
+    'rasterize_segments', 'ILI9341_API',
 ]
 
 
@@ -144,10 +145,57 @@ def rgb565to24(ch, cl):
     return r << 16 | g << 8 | b
 
 
+def rgb888to565_array(img):
+    '''
+    Pack RGB888 image (h, w, 3) into big-endian RGB565 array (h, w), which
+    has the same memory layout as framebuffer of ILI9341_API.
+    '''
+    shape = img.shape[:2]
+    out = ILI9341_API._pack_rgb565(
+        img, np.empty(shape, np.int32), np.empty(shape, np.int32))
+    return out.astype('>u2')
+
+
+def rasterize_segments(x1, y1, x2, y2):
+    '''
+    Rasterize line segments from (x1, y1) to (x2, y2) all at once with only
+    integer arithmetic. Each segment is sampled at every step of its major
+    axis, so pixels are connected without gaps, like Bresenham's algorithm.
+
+    Returns
+    -------
+    x, y : ndarray
+        Coordinates of pixels, end points included.
+    index : ndarray
+        Index of segment that each pixel belongs to.
+    '''
+    x1, y1, x2, y2 = [
+        np.asarray(v, np.int64).ravel() for v in (x1, y1, x2, y2)]
+    dx, dy = x2 - x1, y2 - y1
+    n = np.maximum(np.abs(dx), np.abs(dy))
+    index = np.repeat(np.arange(len(n)), n + 1)
+    t = np.arange(len(index)) - (np.cumsum(n + 1) - (n + 1))[index]
+    m = 2 * np.maximum(n, 1)[index]
+    # x1 + round(dx * t / n), rounded by floor division on integers
+    x = x1[index] + (2 * dx[index] * t + m // 2) // m
+    y = y1[index] + (2 * dy[index] * t + m // 2) // m
+    return x, y, index
+
+
 class ILI9341_API(spidev.SpiDev):
     _lock = threading.Lock()
+    GPIO = SysfsGPIO
+
+    # In batch mode, two dirty areas are merged into their bounding box if
+    # it costs less than `merge_slack` extra pixels, because setting address
+    # window of each area takes several SPI transfers and D/C toggles.
+    merge_slack = 512
 
-    def __init__(self, dc, rst=None, width=320, height=240, *a, **k):
+    # Max number of glyphs of (font, size, char) cached for draw_text
+    glyph_cache_size = 512
+
+    def __init__(self, dc, rst=None, width=320, height=240, batch=False,
+                 *a, **k):
         '''
         Create an interface of ILI9341 SPI Screen by establishing SPI
         connection through `/dev/spidev*.*`. GPIO number of D/C pin must be
@@ -164,6 +212,8 @@ class ILI9341_API(spidev.SpiDev):
             Reset pin number
         width, height : int
             screen width and height in pixel, default 320 x 240
+        batch : bool
+            Whether to only mark dirty areas when drawing, see `commit`.
 
         Notes
         -----
@@ -171,19 +221,33 @@ class ILI9341_API(spidev.SpiDev):
             1. maintain a framebuffer (self.fb)
             2. draw on framebuffer (self.draw_*)
             3. render framebuffer to screen (self.flush)
+
+        In batch mode, `flush` only marks an area as dirty. Overlapping and
+        nearby dirty areas are merged, and `commit` pushes each of them to
+        screen at once:
+        >>> ili.batch = True
+        >>> for x, y in points:
+        ...     ili.draw_point(x, y, ILI9341_RED)
+        >>> ili.commit()
         '''
-        self._dc = SysfsGPIO(dc)
+        self._dc = self.GPIO(dc)
         if rst is None:
             self._rst = None
         else:
-            self._rst = SysfsGPIO(rst)
+            self._rst = self.GPIO(rst)
         self._opened = False
+        self.batch = batch
+        self._dirty = np.zeros((0, 4), np.int64)  # x1, y1, x2, y2
 
         self.width = width
         self.height = height
         self.fb = np.zeros((self.height, self.width, 2), np.uint8)
         self.font = None
         self.size = 16
+        self._glyphs = OrderedDict()  # LRU cache of glyph alpha masks
+        self._glyph_lock = threading.Lock()
+        self._buffers = {}  # scratch buffers used by draw_img & draw_text
+        self._draw_lock = threading.Lock()
 
     def open(self, dev, max_speed_hz=25000000):
         assert not self._opened, 'already used spidev{}.{}'.format(*self._dev)
@@ -226,6 +290,9 @@ class ILI9341_API(spidev.SpiDev):
         '''Write an array of bytes to screen as display data'''
         if len(data):
             self._dc.value = 1
+            if isinstance(data, memoryview) and hasattr(self, 'writebytes2'):
+                # spidev >= 3.4 splits buffer into transfers by itself
+                return self.writebytes2(data)
             for s in range(0, len(data), chunk):
                 self.xfer2(data[s:(s + chunk)])
 
@@ -242,10 +309,49 @@ class ILI9341_API(spidev.SpiDev):
         self._command(0x2C)  # write to RAM
 
     def flush(self, x1, y1, x2, y2):
-        '''write data in framebuffer to screen'''
+        '''write data in framebuffer to screen, or mark it in batch mode'''
+        x1, x2 = max(x1, 0), min(x2, self.width - 1)
+        y1, y2 = max(y1, 0), min(y2, self.height - 1)
+        if x1 > x2 or y1 > y2:
+            return
+        if self.batch:
+            with self._lock:
+                self._mark(x1, y1, x2, y2)
+            return
+        with self._lock:
+            self._push(x1, y1, x2, y2)
+
+    def commit(self):
+        '''Push all dirty areas marked in batch mode to screen.'''
         with self._lock:
-            self._set_window(x1, y1, x2, y2)
-            self._data(self.fb[y1:y2+1, x1:x2+1].flatten().tolist())
+            dirty, self._dirty = self._dirty, self._dirty[:0]
+            for x1, y1, x2, y2 in dirty.tolist():
+                self._push(x1, y1, x2, y2)
+        return len(dirty)
+
+    def _push(self, x1, y1, x2, y2):
+        self._set_window(x1, y1, x2, y2)
+        # no copy if the area spans whole rows of framebuffer
+        buf = np.ascontiguousarray(self.fb[y1:y2 + 1, x1:x2 + 1])
+        self._data(memoryview(buf.reshape(-1)))
+
+    def _mark(self, x1, y1, x2, y2):
+        '''Add a dirty area, merging it with others while it's worthy.'''
+        area = (x2 - x1 + 1) * (y2 - y1 + 1)
+        while len(self._dirty):
+            d = self._dirty
+            bx1, by1 = np.minimum(d[:, 0], x1), np.minimum(d[:, 1], y1)
+            bx2, by2 = np.maximum(d[:, 2], x2), np.maximum(d[:, 3], y2)
+            union = (bx2 - bx1 + 1) * (by2 - by1 + 1)
+            cost = union - area - (d[:, 2] - d[:, 0] + 1) * (
+                d[:, 3] - d[:, 1] + 1)
+            i = cost.argmin()
+            if cost[i] > self.merge_slack:
+                break
+            x1, y1, x2, y2 = bx1[i], by1[i], bx2[i], by2[i]
+            area = union[i]
+            self._dirty = np.delete(d, i, 0)
+        self._dirty = np.vstack([self._dirty, [(x1, y1, x2, y2)]])
 
     def reset(self):
         if self._rst is None:
@@ -313,25 +419,82 @@ class ILI9341_API(spidev.SpiDev):
         self.fb[y, x] = c
         self.flush(x, y, x, y)
 
+    def _plot(self, x, y, c, flush=True):
+        '''Draw pixels inside screen with color(s) `c`.'''
+        mask = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        x, y = x[mask], y[mask]
+        if np.ndim(c) == 2:  # color of each pixel
+            c = np.asarray(c)[mask]
+        if not len(x):
+            return
+        self.fb[y, x] = c
+        if flush:
+            self.flush(x.min(), y.min(), x.max(), y.max())
+
     def draw_line(self, x1, y1, x2, y2, c, *a, **k):
         # draw vertical or horizontal line
         if (x1 == x2) or (y1 == y2):
-            self.draw_rectf(x1, y1, x2, y2, c)
+            self.draw_rectf(min(x1, x2), min(y1, y2), max(x1, x2),
+                            max(y1, y2), c)
             return
         # draw a line cross point(x1, y1) and point(x2, y2)
-        # 1. get line function `y = k * x + b`
-        k, b = np.polyfit([x1, x2], [y1, y2], 1)
-        if abs(y2 - y1) > abs(x2 - x1):
-            # 2. use y as index to get smoother line
-            _y = np.arange(min(y1, y2), max(y1, y2)).astype(np.uint16)
-            _x = np.round((_y - b) / k).astype(np.uint16)
+        x, y, _ = rasterize_segments(x1, y1, x2, y2)
+        self._plot(x, y, c)
+
+    def draw_polyline(self, xs, ys, c, *a, **k):
+        '''Draw lines connecting points (xs[i], ys[i]) and flush once.'''
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        if len(xs) < 2:
+            return self._plot(xs.astype(int), ys.astype(int), c)
+        x, y, _ = rasterize_segments(xs[:-1], ys[:-1], xs[1:], ys[1:])
+        self._plot(x, y, c)
+
+    def draw_waveform(self, data, rect=None, scale=None, c=ILI9341_WHITE,
+                      bg=None, *a, **k):
+        '''
+        Draw channels of `data` as waveforms in horizontal bands of `rect`.
+
+        Parameters
+        ----------
+        data : array
+            Signal with a shape of num_channel x num_samples. Samples are
+            evenly spread across width of `rect`.
+        rect : tuple, optional
+            Area (x1, y1, x2, y2) to draw in, default whole screen.
+        scale : float, optional
+            Pixels per unit of data. By default each channel is centered
+            and scaled to fit in its band.
+        c : color or list of colors
+            Color of all channels, or color of each channel.
+        bg : color, optional
+            Clear `rect` with color `bg` before drawing.
+        '''
+        data = np.atleast_2d(data)
+        x1, y1, x2, y2 = rect or (0, 0, self.width - 1, self.height - 1)
+        nch, n = data.shape
+        height = (y2 - y1 + 1) / float(nch)
+        top = np.int64(y1 + height * np.arange(nch))[:, None]
+        bottom = np.int64(y1 + height * np.arange(1, nch + 1))[:, None] - 1
+        if scale is None:
+            data = data - data.mean(axis=1, keepdims=True)
+            peak = np.abs(data).max(axis=1, keepdims=True)
+            scale = (height / 2 - 1) / np.where(peak > 0, peak, 1)
+        y = np.round((top + bottom) / 2.0 - data * scale)
+        y = np.clip(np.nan_to_num(y), top, bottom).astype(np.int64)
+        x = x1 + np.arange(n) * (x2 - x1) // max(n - 1, 1)
+        x = np.broadcast_to(x, y.shape)
+        if n < 2:
+            px, py, index = x.ravel(), y.ravel(), np.arange(nch)
         else:
-            # 2. use x as index to get smoother line
-            _x = np.arange(min(x1, x2), max(x1, x2)).astype(np.uint16)
-            _y = np.round(k * _x + b).astype(np.uint16)
-        # 3. plot _x, _y on framebuffer
-        self.fb[_y, _x] = c
-        self.flush(_x.min(), _y.min(), _x.max(), _y.max())
+            px, py, index = rasterize_segments(
+                x[:, :-1], y[:, :-1], x[:, 1:], y[:, 1:])
+            index //= n - 1  # segment index to channel index
+        colors = np.asarray(c, np.uint8).reshape(-1, 2)
+        if bg is not None:
+            self.fb[y1:y2 + 1, x1:x2 + 1] = bg
+        self._plot(px, py, colors[index % len(colors)], flush=bg is None)
+        if bg is not None:
+            self.flush(x1, y1, x2, y2)
 
     def draw_rect(self, x1, y1, x2, y2, c, *a, **k):
         self.fb[y1, x1:x2] = self.fb[y2, (x1 + 1):(x2 + 1)] = c
@@ -437,30 +600,45 @@ class ILI9341_API(spidev.SpiDev):
         self.draw_rectf(x2 - r, y1 + r, x2, y2 - r, c)
 
     def draw_img(self, x, y, img, *a, **k):
-        '''draw RGB[A] img with shape of (height, width, depth) at (x, y)'''
-        img = np.atleast_3d(img).astype(np.uint8)
-        x1, y1 = x, y
-        x2 = max(min(x1 + img.shape[1], self.width), x1)
-        y2 = max(min(y1 + img.shape[0], self.height), y1)
-        # img shape correction and extracting alpha channel
-        img = img[:(y2 - y1), :(x2 - x1)].astype(np.int16)
-        if img.shape[2] == 4:
-            img, alpha = np.split(img, [-1], axis=-1)
-            alpha = alpha.astype(np.float) / 255
-        else:
-            if img.shape[2] != 3:
-                img = np.repeat(img[:, :, 0], 3, axis=-1)
-            alpha = np.ones((y2 - y1, x2 - x1, 1), np.float)
-
-        # calculate difference of image and current framebuffer
-        current = np.split(self.fb[y1:y2, x1:x2].astype(np.uint16), 2, -1)
-        current = np.int16(np.concatenate(rgb565to888_pro(*current), -1))
-        # weight it with alpha channel
-        dest = current + (img - current) * alpha
-        # convert to rgb565 and draw back on framebuffer
-        dest = np.split(dest.astype(np.uint16), 3, -1)
-        dest = np.concatenate(rgb888to565_pro(*dest), -1).astype(np.uint8)
-        self.fb[y1:y2, x1:x2] = dest
+        '''
+        draw RGB[A] img with shape of (height, width, depth) at (x, y),
+        or RGB565 img with shape of (height, width) and 16-bit dtype
+        '''
+        img = np.asarray(img)
+        packed = (img.ndim == 2 and img.dtype.kind == 'u' and
+                  img.dtype.itemsize == 2)
+        if not packed:
+            img = np.atleast_3d(img)
+            if img.dtype != np.uint8:
+                img = img.astype(np.uint8)
+        x1, y1 = max(x, 0), max(y, 0)
+        x2 = min(x + img.shape[1], self.width)
+        y2 = min(y + img.shape[0], self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        img = img[y1 - y:y2 - y, x1 - x:x2 - x]
+        if packed:
+            with self._draw_lock:
+                if img.dtype.str == '>u2':  # same layout as framebuffer
+                    self.fb[y1:y2, x1:x2] = img.view(np.uint8).reshape(
+                        y2 - y1, x2 - x1, 2)
+                else:
+                    self._unpack(img, self.fb[y1:y2, x1:x2])
+            self.flush(x1, y1, x2 - 1, y2 - 1)
+            return
+        rgb = img if img.shape[2] in (3, 4) else img[..., [0, 0, 0]]
+        shape = img.shape[:2]
+        with self._draw_lock:
+            src = self._pack_rgb565(
+                rgb, self._scratch('src', shape), self._scratch('tmp', shape))
+            if img.shape[2] == 4 and img[..., 3].min() < 255:
+                # alpha 0-255 to 0-256 so that blending is done by `>> 8`
+                alpha = self._scratch('alpha', shape)
+                np.right_shift(img[..., 3], 7, out=alpha, dtype=np.int32)
+                alpha += img[..., 3]
+                self._blend565(x1, y1, x2, y2, src, alpha)
+            else:  # opaque image, just overwrite framebuffer
+                self._unpack(src, self.fb[y1:y2, x1:x2])
         self.flush(x1, y1, x2 - 1, y2 - 1)
 
     def draw_text(self, x, y, s, c, size=None, font=None, *a, **k):
@@ -469,11 +647,112 @@ class ILI9341_API(spidev.SpiDev):
         if size is not None and self.size != size:
             self.setsize(size)
         assert self.font, '[ILI9341 API] font not set yet!'
-        w, h = self.font.getsize(s)
-        img = Image.new(mode='RGBA', size=(w, h))
-        ImageDraw.Draw(img).text((0, 0), s, rgb565to888(*c), font)
-        img = img.resize((w // 2, h // 2), resample=Image.ANTIALIAS)
-        self.draw_img(x, y, np.array(img, dtype=np.uint8))
+        if isinstance(s, bytes):
+            s = s.decode('utf8')
+        if not s:
+            return
+        alpha = np.hstack([self._glyph(char) for char in s])
+        self._blend(x, y, alpha, c)
+
+    def _glyph(self, char):
+        '''
+        Return alpha mask of `char` rendered with current font and size.
+        Glyphs are drawn at 2x size then down-sampled for anti-aliasing,
+        and alpha values are scaled to 0-256 for integer blending. Color is
+        applied when blending, so a glyph is shared by all colors.
+        '''
+        key = (self.font.path, self.size, char)
+        with self._glyph_lock:
+            glyph = self._glyphs.pop(key, None)
+        if glyph is None:
+            if hasattr(self.font, 'getlength'):  # Pillow >= 8.0
+                w = int(np.ceil(self.font.getlength(char)))
+            else:
+                w = self.font.getsize(char)[0]
+            h = sum(self.font.getmetrics())  # same height for all glyphs
+            img = Image.new(mode='L', size=(max(w, 2), h))
+            ImageDraw.Draw(img).text((0, 0), char, 255, self.font)
+            img = img.resize((w // 2, h // 2), resample=Image.LANCZOS)
+            glyph = np.array(img, np.uint16).reshape(h // 2, w // 2)
+            glyph += glyph >> 7
+        with self._glyph_lock:
+            self._glyphs[key] = glyph
+            while len(self._glyphs) > self.glyph_cache_size:
+                self._glyphs.popitem(last=False)
+        return glyph
+
+    def _blend(self, x, y, alpha, c):
+        '''Blend RGB565 color `c` onto framebuffer with 0-256 alpha mask.'''
+        x1, y1 = max(x, 0), max(y, 0)
+        x2 = min(x + alpha.shape[1], self.width)
+        y2 = min(y + alpha.shape[0], self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        alpha = alpha[y1 - y:y2 - y, x1 - x:x2 - x]
+        with self._draw_lock:
+            self._blend565(x1, y1, x2, y2, c[0] << 8 | c[1], alpha)
+        self.flush(x1, y1, x2 - 1, y2 - 1)
+
+    def _scratch(self, name, shape):
+        '''Reusable int32 buffer, only re-allocated when it's too small.'''
+        size = shape[0] * shape[1]
+        buf = self._buffers.get(name)
+        if buf is None or buf.size < size:
+            buf = self._buffers[name] = np.empty(size, np.int32)
+        return buf[:size].reshape(shape)
+
+    @staticmethod
+    def _pack_rgb565(img, out, tmp):
+        '''RGB888 (h, w, 3) to RGB565 (h, w) like `rgb888to565_pro`.'''
+        np.multiply(img[..., 0], 249, out=out, dtype=np.int32)
+        out += 1014
+        out &= 0xF800
+        np.multiply(img[..., 1], 253, out=tmp, dtype=np.int32)
+        tmp += 505
+        tmp >>= 5
+        tmp &= 0x07E0
+        out |= tmp
+        np.multiply(img[..., 2], 249, out=tmp, dtype=np.int32)
+        tmp += 1014
+        tmp >>= 11
+        out |= tmp
+        return out
+
+    @staticmethod
+    def _unpack(src, fb):
+        '''Write RGB565 (h, w) into framebuffer area (h, w, 2).'''
+        np.right_shift(src, 8, out=fb[..., 0], casting='unsafe')
+        np.bitwise_and(src, 0xFF, out=fb[..., 1], casting='unsafe')
+
+    def _blend565(self, x1, y1, x2, y2, src, alpha):
+        '''
+        Blend RGB565 `src` (a color or an array) onto framebuffer area with
+        0-256 alpha. Each field is blended by fixed-point arithmetic:
+            dst + ((src - dst) * alpha + 128) >> 8
+        '''
+        fb = self.fb[y1:y2, x1:x2]
+        shape = fb.shape[:2]
+        dst, out = self._scratch('dst', shape), self._scratch('out', shape)
+        cur, tgt = self._scratch('cur', shape), self._scratch('tgt', shape)
+        np.left_shift(fb[..., 0], 8, out=dst, dtype=np.int32)
+        dst |= fb[..., 1]
+        out.fill(0)
+        for shift, mask in ((11, 0x1F), (5, 0x3F), (0, 0x1F)):
+            np.right_shift(dst, shift, out=cur)
+            cur &= mask
+            if np.ndim(src):
+                np.right_shift(src, shift, out=tgt)
+                tgt &= mask
+            else:
+                tgt.fill(src >> shift & mask)
+            tgt -= cur
+            tgt *= alpha
+            tgt += 128
+            tgt >>= 8
+            tgt += cur
+            tgt <<= shift
+            out |= tgt
+        self._unpack(out, fb)
 
     def set_rotation(self, m):
         with self._lock:
@@ -362,7 +362,10 @@ def load_mat(fn):
             if k[0] == k[-1] == '_':
                 keys.remove(k)
                 continue
-            replst = [_ for _ in keys[1:] if _.startswith(k)] + [k]
+            # chunks appended by `sort_mat` are named `k`, `k/1`, `k/2`...
+            replst = [k] + sorted([
+                _ for _ in keys[1:] if _.startswith(k + '/')
+            ], key=lambda _: int(_.rsplit('/', 1)[1]))
             arrays = [dct.pop(keys.pop(keys.index(_))) for _ in replst]
             dct[k] = [arr[0] if arr.size else [] for arr in arrays]
             if isinstance(dct[k][0], (np.ndarray, list, tuple)):
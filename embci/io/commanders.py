@@ -17,8 +17,9 @@ import select
 import threading
 import traceback
 
-# requirements.txt: data: pylsl
+# requirements.txt: data: numpy, pylsl
 # requirements.txt: drivers: pyserial
+import numpy as np
 import pylsl
 import serial
 
@@ -27,6 +28,7 @@ from ..utils import (
     LoopTaskInThread, Singleton
 )
 from ..constants import command_dict_null, command_dict_plane
+from .readers import pack_frame
 from . import logger
 
 __all__ = ['SocketTCPServer'] + [
@@ -200,10 +202,12 @@ class SerialCommander(BaseCommander):
 class SocketTCPServer(LoopTaskInThread):
     '''
     Socket TCP server on host:port, default to 0.0.0.0:0. A data broadcaster.
+    Use `multicast_frame` to send data to `embci.io.SocketTCPReader`.
     '''
     def __init__(self, host='0.0.0.0', port=0):
         self.host, self.port = host, port
         self._conns, self._addrs = [], []
+        self._frame_seq = 0
         self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         LoopTaskInThread.__init__(self, self.manager)
 
@@ -270,6 +274,21 @@ class SocketTCPServer(LoopTaskInThread):
         for con in self._conns:
             self.send(con, data)
 
+    def multicast_frame(self, data, ts=None):
+        '''
+        Multicast samples as a length-prefixed frame, see `pack_frame`.
+        `data` is num_channel x n block or one sample of each channel.
+        Timestamp `ts` of first sample defaults to current time.
+        '''
+        data = np.asarray(data)
+        if data.ndim < 2:
+            data = data.reshape(-1, 1)
+        frame = pack_frame(self._frame_seq, data,
+                           time.time() if ts is None else ts, prefix=True)
+        self._frame_seq += 1
+        for con in self._conns:
+            self.send(con, frame)
+
     def hook_after(self):
         for con in self._conns:
             con.close()
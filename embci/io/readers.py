@@ -28,19 +28,28 @@ import os
 import re
 import time
 import mmap
+import errno
+import select
 import socket
+import struct
 import warnings
 import threading
+import traceback
 import multiprocessing as mp
-from ctypes import c_bool, c_char_p, c_uint8, c_uint16, c_float
+from fractions import Fraction
+from ctypes import (
+    c_bool, c_char, c_uint8, c_uint32, c_uint64, c_float, c_double,
+    Structure, sizeof, addressof, memmove
+)
 
-# requirements.txt: data: numpy, scipy, pylsl
+# requirements.txt: data: numpy, scipy, pylsl, mne==0.17
 # requirements.txt: drivers: pyserial
 import numpy as np
 import scipy.io
 import scipy.signal
 import pylsl
 import serial
+import mne
 
 from ..utils import (
     ensure_unicode, ensure_bytes, get_boolean, format_size,
@@ -51,13 +60,16 @@ from ..utils import (
 from ..drivers.ads1299 import ADS1299_API
 from ..drivers.esp32 import ESP32_API
 from ..configs import DIR_PID, DIR_TMP
+from .base import load_mat
 from . import logger
 
-__all__ = ['validate_readername', 'FakeDataGenerator', ] + [
+__all__ = [
+    'validate_readername', 'pack_frame', 'unpack_frame', 'FakeDataGenerator',
+] + [
     _ + 'Reader' for _ in (
         'Files', 'LSL', 'Serial',
         'ADS1299SPI', 'ESP32SPI',
-        'SocketTCP', 'SocketUDP',
+        'SocketTCP', 'SocketUDP', 'Merged',
     )
 ]
 
@@ -83,6 +95,50 @@ def validate_readername(name):                                     # noqa: E302
     return '%s_%d' % (name, list(set(range(len(ids) + 1)).difference(ids))[0])
 
 
+class ReaderState(Structure):
+    '''
+    Shared state of a reader. It's stored at the head of the memory-mapped
+    file, right before the data buffer, so that all processes see the same
+    values. Hot fields (write sequence) are read without any lock, and
+    control-plane fields are written with one lock `reader._state_lock`.
+    '''
+    _fields_ = [
+        ('seq',          c_uint64),        # ring buffer write sequence
+        ('seqlock',      c_uint32),        # odd while producer is writing
+        ('waiters',      c_uint32),        # number of blocked consumers
+        ('frames_recv',  c_uint64),        # counters of framed readers
+        ('frames_lost',  c_uint64),
+        ('frames_bad',   c_uint64),
+        ('ring_size',    c_uint32),
+        ('window_size',  c_uint32),
+        ('sample_rate',  c_uint32),
+        ('sample_time',  c_float),
+        ('start_time',   c_double),
+        ('num_channel',  c_uint8),
+        ('started',      c_bool),
+        ('status',       c_char * 16),
+        ('input_source', c_char * 256),
+    ]
+
+
+# data buffer starts at a cache-line aligned offset after state
+READER_STATE_SIZE = (sizeof(ReaderState) + 63) // 64 * 64
+
+
+def _state_property(field, text=False):
+    '''Serve a field of `self._state` as property of reader.'''
+    def fget(self):
+        value = getattr(self._state, field)
+        return ensure_unicode(value) if text else value
+
+    def fset(self, value):
+        if text:
+            value = ensure_bytes(value)[:getattr(ReaderState, field).size - 1]
+        with self._state_lock:
+            setattr(self._state, field, value)
+    return property(fget, fset, None, 'shared property ' + field)
+
+
 class StatusMixin(object):
     def is_streaming(self):
         if hasattr(self, '_task'):
@@ -96,14 +152,19 @@ class StatusMixin(object):
         if not self.is_streaming():
             return 0
         # 1. frequency of last point
-        #  idx = self._index - 1
+        #  idx = (self.ring_seq - 1) % self._ring_size
         #  dt = self._data[-1, idx] - self._data[-1, idx - 1]
         #  return 1 / dt if dt else 0
 
         # 2. averaged frequency of last frame
-        idx = self._index
-        dT = self._data[-1, idx - 1] - self._data[-1, idx]
-        return self.window_size / dT if dT else 0
+        seq = self.ring_seq
+        n = min(seq, self.window_size) - 1
+        if n < 1:
+            return 0
+        size = self._ring_size
+        last, first = (seq - 1) % size, (seq - 1 - n) % size
+        dT = self._data[-1, last] - self._data[-1, first]
+        return n / dT if dT else 0
 
     def __getitem__(self, items):
         # TODO: May integret data processing algorithm in readers
@@ -151,6 +212,222 @@ class ReaderIOMixin(object):
             return False
         return True
 
+    # =========================================================================
+    # Single-producer / multi-consumer ring buffer
+    #
+    # Only the loop task (producer) writes `self._data`. A 64-bit write
+    # sequence `ring_seq` counts samples ever written, and sample `n` lives at
+    # column `n % self._ring_size`. Consumers keep their own cursors (sequence
+    # numbers, see `self._lasti`) so reading needs no lock at all. Updating of
+    # the sequence is guarded by a seqlock counter which is odd while producer
+    # is writing, so that a torn 64-bit value is never observed.
+
+    @property
+    def ring_seq(self):
+        '''Number of samples written into buffer since reader started.'''
+        state = self._state
+        while True:
+            gen = state.seqlock
+            if not gen & 1:
+                value = state.seq
+                if state.seqlock == gen:
+                    return value
+            time.sleep(0)  # producer is writing, this will be very short
+
+    def ring_lost(self, start):
+        '''
+        Number of samples since sequence `start` that have been overwritten by
+        producer. Zero-copy consumers should check this after using the views.
+        '''
+        return max(0, self.ring_seq - start - self._ring_size)
+
+    def ring_segments(self, start, stop):
+        '''
+        Return views of buffer covering samples from sequence `start` to
+        `stop` (not included). No data is copied, two views will be returned
+        if the range wraps around the end of buffer.
+        '''
+        size, n = self._ring_size, stop - start
+        if n <= 0:
+            return (self._data[:, :0], )
+        if n > size:
+            raise ValueError('Out of buffer range: %d > %d' % (n, size))
+        i = start % size
+        if i + n <= size:
+            return (self._data[:, i:i + n], )
+        return (self._data[:, i:], self._data[:, :i + n - size])
+
+    def snapshot(self, out=None, n=None, stop=None, retry=3):
+        '''
+        Copy `n` samples before sequence `stop` into a preallocated array.
+
+        Parameters
+        ----------
+        out : ndarray, optional
+            Array with a shape of (num_channel + time_channel) x n to write
+            into. A new array will be allocated if not provided.
+        n : int, optional
+            Number of samples, default `window_size`.
+        stop : int, optional
+            Sequence number where the snapshot ends. Default `ring_seq`.
+
+        Returns
+        -------
+        out : ndarray
+        '''
+        n = self.window_size if n is None else n
+        stop = self.ring_seq if stop is None else stop
+        if out is None:
+            out = np.empty((self._data.shape[0], n), self._data.dtype)
+        elif out.shape != (self._data.shape[0], n):
+            raise ValueError('Invalid output shape: {}'.format(out.shape))
+        for _ in range(retry):
+            i = 0
+            for seg in self.ring_segments(stop - n, stop):
+                out[:, i:i + seg.shape[1]] = seg
+                i += seg.shape[1]
+            if not self.ring_lost(stop - n):
+                break
+            # producer lapped us while copying, try on the latest window
+            stop = self.ring_seq
+        else:
+            logger.warning(self.name + ' data overwritten while reading')
+        return out
+
+    def data_since(self, cursor, copy=True):
+        '''
+        Pick (num_channel + time_channel) x n data written after `cursor`.
+
+        Parameters
+        ----------
+        cursor : int
+            Sequence number returned by last call, or `reader.ring_seq`.
+        copy : bool
+            If False, return a tuple of views of buffer instead of a new
+            array. Views are valid until producer overwrites them, check it
+            by `reader.ring_lost(cursor - n)` after using.
+
+        Returns
+        -------
+        data : ndarray | tuple of ndarray
+        cursor : int
+            New cursor to be passed in at next call.
+        '''
+        seq = self.ring_seq
+        start = max(cursor, seq - self._ring_size)
+        if start > cursor:
+            logger.warning('{} {} samples lost before reading'.format(
+                self.name, start - cursor))
+        segments = self.ring_segments(start, seq)
+        if not copy:
+            return segments, seq
+        data = np.concatenate(segments, -1)
+        lost = self.ring_lost(start)
+        if lost:
+            logger.warning('{} {} samples lost while reading'.format(
+                self.name, lost))
+            data = data[:, lost:]
+        return data, seq
+
+    # =========================================================================
+    # Blocking data wait
+    #
+    # Consumers sleep on a `multiprocessing.Condition` until producer notifies
+    # that new samples are written. Producer only takes the lock when there
+    # is someone waiting (counted by `self._state.waiters`).
+
+    def wait_for_samples(self, n=1, timeout=None, cursor=None):
+        '''
+        Block until `n` samples have been written after `cursor`.
+
+        Parameters
+        ----------
+        n : int
+            Number of new samples to wait for, default 1.
+        timeout : float, optional
+            Max seconds to wait. Block until data arrive or the reader is
+            paused/closed if not provided.
+        cursor : int, optional
+            Sequence number to count from. Default current `ring_seq`.
+
+        Returns
+        -------
+        seq : int
+            Current write sequence, which is less than `cursor + n` when
+            timeout or reader stopped.
+        '''
+        seq = self.ring_seq
+        target = (seq if cursor is None else cursor) + n
+        if seq >= target:
+            return seq
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._mp_cond:
+            self._state.waiters += 1
+            try:
+                # re-check after registered as waiter, otherwise samples
+                # written before `waiters += 1` will not notify us
+                seq = self.ring_seq
+                while seq < target:
+                    if not self.started or self.status == 'paused':
+                        break
+                    if timeout is None:
+                        # wake up sometimes to check reader status
+                        self._mp_cond.wait(1)
+                    else:
+                        remain = deadline - time.time()
+                        if remain <= 0:
+                            break
+                        self._mp_cond.wait(remain)
+                    seq = self.ring_seq
+            finally:
+                self._state.waiters -= 1
+        return seq
+
+    def wait_for_frame(self, timeout=None, cursor=None):
+        '''
+        Block until next non-overlapped frame after `cursor` is full, i.e.
+        the write sequence reaches next multiple of `window_size`.
+
+        See Also
+        --------
+        wait_for_samples
+        '''
+        W = self.window_size
+        cursor = self.ring_seq if cursor is None else cursor
+        return self.wait_for_samples(
+            (cursor // W + 1) * W - cursor, timeout, cursor)
+
+    def _data_notify(self):
+        '''Wake up consumers blocked in `wait_for_samples`.'''
+        if self._state.waiters:
+            with self._mp_cond:
+                self._mp_cond.notify_all()
+
+    def data_last(self, n=None):
+        '''
+        Pick (num_channel + time_channel) x n latest data from buffer.
+        `n` defaults to window_size and can be up to the buffer capacity set
+        by `history_seconds`.
+        '''
+        return self.snapshot(n=self.window_size if n is None else int(n))
+
+    def data_range(self, t0, t1=None):
+        '''
+        Pick (num_channel + time_channel) x n data whose timestamps are in
+        range [t0, t1). Time is in seconds, same as the time channel. Only
+        data still in buffer (see `history_seconds`) can be picked.
+        '''
+        seq = self.ring_seq
+        start = max(0, seq - self._ring_size)
+        ts = np.concatenate(
+            [seg[-1] for seg in self.ring_segments(start, seq)])
+        i = start + np.searchsorted(ts, t0)
+        j = seq if t1 is None else start + np.searchsorted(ts, t1)
+        data = self.snapshot(n=max(0, j - i), stop=j, retry=1)
+        lost = self.ring_lost(i)  # the oldest data may be overwritten
+        return data[:, lost:] if lost else data
+
     @property
     def data_channel(self):
         '''Pick num_channel x 1 fresh data from buffer.'''
@@ -160,15 +437,14 @@ class ReaderIOMixin(object):
     def data_channel_t(self):
         '''Pick (num_channel + time_channel) x 1 fresh data from buffer.'''
         if self.is_streaming():
-            t = time.time()
-            while self._lasti[0] == self._index:
-                time.sleep(0)
-                if (time.time() - t) > (10.0 / self.sample_rate):
-                    logger.warning(self.name + ' read data timeout')
-                    break
-            self._lasti[0] = self._index
-        data, idx = self._data.copy(), self._lasti[0] - 1
-        return data[:, idx]
+            seq = self.wait_for_samples(
+                1, 10.0 / self.sample_rate, self._lasti[0])
+            if seq == self._lasti[0]:
+                logger.warning(self.name + ' read data timeout')
+        else:
+            seq = self.ring_seq
+        self._lasti[0] = seq
+        return self._data[:, (self._lasti[0] - 1) % self._ring_size].copy()
 
     @property
     def data_frame(self):
@@ -178,36 +454,59 @@ class ReaderIOMixin(object):
     @property
     def data_frame_t(self):
         '''Pick (num_channel + time_channel) x window_size from buffer.'''
+        return self.snapshot(stop=self._frame_stop())
+
+    @property
+    def data_frame_view(self):
+        '''
+        Same as `data_frame_t` but return views of buffer without copying.
+        One or two segments will be returned, concatenate them to get the
+        frame. Views are mutated in place by producer, use `snapshot` if
+        you need a stable copy.
+        '''
+        stop = self._frame_stop()
+        return self.ring_segments(stop - self.window_size, stop)
+
+    def _frame_stop(self):
         if self.is_streaming():
-            t = time.time()
-            while self._lasti[1] == self._index:
-                time.sleep(0)
-                if (time.time() - t) > (10.0 / self.sample_rate):
-                    logger.warning(self.name + ' read data timeout')
-                    break
-            self._lasti[1] = self._index
-        data, idx = self._data.copy(), self._lasti[1]
-        return np.concatenate((data[:, idx:], data[:, :idx]), -1)
+            seq = self.wait_for_samples(
+                1, 10.0 / self.sample_rate, self._lasti[1])
+            if seq == self._lasti[1]:
+                logger.warning(self.name + ' read data timeout')
+        else:
+            seq = self.ring_seq
+        self._lasti[1] = seq
+        return seq
 
     @property
     def data_all(self):
         '''
         Pick (num_channel + time_channel) x window_size from buffer.
-        Start from where index equals to 0.
+        Frames are continuous and not overlapped, i.e. each frame ends where
+        sequence is a multiple of window_size.
+        '''
+        return self.snapshot(stop=self._all_stop())
+
+    @property
+    def data_all_view(self):
         '''
+        Same as `data_all` but return views of buffer without copying.
+
+        See Also
+        --------
+        data_frame_view
+        '''
+        stop = self._all_stop()
+        return self.ring_segments(stop - self.window_size, stop)
+
+    def _all_stop(self):
+        W = self.window_size
         if self.is_streaming():
-            t = time.time()
-            while self._index or self._lasti[2] == self._data[-1, self._index]:
-                if self._index < self.window_size // 2:
-                    time.sleep(self.sample_time * 0.4)
-                else:
-                    time.sleep(0)
-                if (time.time() - t) > 10 * self.sample_time:
-                    logger.warning(self.name + ' read data timeout')
-                    break
-            self._lasti[2] = self._data[-1, self._index]
-        data, idx = self._data.copy(), self._index
-        return np.concatenate((data[:, idx:], data[:, :idx]), -1)
+            seq = self.wait_for_frame(10 * self.sample_time, self._lasti[2])
+            if seq < (self._lasti[2] // W + 1) * W:
+                logger.warning(self.name + ' read data timeout')
+        self._lasti[2] = self.ring_seq // W * W
+        return self._lasti[2]
 
 
 class CompatMixin(object):
@@ -239,6 +538,19 @@ class CompatMixin(object):
 class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
     name = 'embci.io.Reader'
     _dtype = np.dtype('float32')
+    # Set to True in subclasses that override `_data_fetch_chunk`
+    _chunk_fetch = False
+
+    # Properties shared among processes, see `ReaderState`
+    __status__   = _state_property('status')                       # noqa: E221
+    __started__  = _state_property('started')                      # noqa: E221
+    input_source = _state_property('input_source', text=True)
+    sample_rate  = _state_property('sample_rate')                  # noqa: E221
+    sample_time  = _state_property('sample_time')                  # noqa: E221
+    window_size  = _state_property('window_size')                  # noqa: E221
+    num_channel  = _state_property('num_channel')                  # noqa: E221
+    start_time   = _state_property('start_time')                   # noqa: E221
+    _ring_size   = _state_property('ring_size')                    # noqa: E221
 
     def __new__(cls, *a, **k):
         '''LoopTaskMixin required attributes are defined here.'''
@@ -246,42 +558,27 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
         # stream control flags used by `embci.utils.LoopTaskMixin`
         obj.__flag_pause__ = mp.Event()
         obj.__flag_close__ = mp.Event()
-        # Basic stream reader attributes.
-        # These values may be accessed in another thread or process.
-        # So make them multiprocessing.Value and serve as properties.
-        for name, type, value in [
-            ('_index',         c_uint16,  0),
-            ('__status__',     c_char_p,  b'closed'),
-            ('__started__',    c_bool,    False),
-            ('input_source',   c_char_p,  b''),
-            ('sample_rate',    c_uint16,  0),
-            ('sample_time',    c_float,   0),
-            ('window_size',    c_uint16,  0),
-            ('num_channel',    c_uint8,   0),
-            ('start_time',     c_float,   0),
-        ]:
-            attr = '_mp_' + name
-            setattr(obj, attr, mp.Value(type, value))
-            if hasattr(BaseReader, name):
-                continue
-            if type is c_char_p:
-                fget = lambda self, attr=attr: (                   # noqa: E731
-                    getattr(self, attr).value.decode('utf8'))
-                fset = lambda self, value, attr=attr: (            # noqa: E731
-                    setattr(getattr(self, attr), 'value', ensure_bytes(value)))
-            else:
-                fget = lambda self, attr=attr: (                   # noqa: E731
-                    getattr(self, attr).value)
-                fset = lambda self, value, attr=attr: (            # noqa: E731
-                    setattr(getattr(self, attr), 'value', value))
-            setattr(BaseReader, name, property(
-                fget, fset, fdel=None, doc='property ' + name))
+        # Basic stream reader attributes may be accessed in another thread
+        # or process. They are packed in one shared `ReaderState` structure
+        # and served as properties. Before reader started, the structure
+        # lives in anonymous shared memory. See `BaseReader._state_bind`.
+        obj._state = None
+        obj._state_bind()
+        obj._state.status = b'closed'
+        obj._state_lock = mp.Lock()
+        # Consumers blocked in `wait_for_samples` sleep on this condition
+        obj._mp_cond = mp.Condition()
         return obj
 
     def __init__(self, sample_rate, sample_time, num_channel, name=None,
-                 input_source=None, broadcast=False, datatype=None, *a, **k):
+                 input_source=None, broadcast=False, datatype=None,
+                 broadcast_chunk=32, broadcast_latency=0.05,
+                 history_seconds=None, *a, **k):
         # Update basic info with arguments
         self.set_sample_rate(sample_rate, sample_time)
+        # Capacity of data buffer in seconds, independent of window_size.
+        # Consumers can pick longer history by `data_last` and `data_range`.
+        self.history_seconds = history_seconds
         self.set_channel_num(num_channel)
         self.input_source = input_source or 'Unknown'
 
@@ -296,18 +593,23 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
             self._lsl_send = True
         else:
             self._lsl_send = False
+        # Samples are buffered and pushed to outlet by chunks, until chunk is
+        # full or the oldest buffered sample has waited for `latency` seconds.
+        self._lsl_chunk = max(1, int(broadcast_chunk))
+        self._lsl_latency = float(broadcast_latency)
 
         # Locked file used to share data among processes
         pidfn = os.path.join(DIR_PID, self.name + '.pid')
         mmapfn = os.path.join(DIR_TMP, 'mmap_' + self.name)
         self._file_pid = LockedFile(pidfn, pidfile=True)
         self._file_data = LockedFile(mmapfn)
+        self._ring_size = self.window_size
         self._data = np.zeros(
-            (self.num_channel + 1, self.window_size), self._dtype)
+            (self.num_channel + 1, self._ring_size), self._dtype)
 
-        # Indexs used to output data
+        # Cursors (sequence numbers) used to output data
         # 0:Channel 1:Frame 2:All 3-5: NotUsed
-        self._lasti = [self._index] * 5
+        self._lasti = [0] * 5
 
     def start(self, method=None, *a, **k):
         if not LoopTaskMixin.start(self):
@@ -315,17 +617,26 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
 
         # lock files to protect writing permission
         self._file_pid.acquire()
-        shape = ((self.num_channel + 1), self.window_size)
+        # Ring buffer is a little longer than window_size so that consumers
+        # can copy a whole frame while producer keeps writing.
+        self._ring_size = max(
+            int((self.history_seconds or 0) * self.sample_rate),
+            self.window_size + max(1, self.window_size // 8))
+        shape = ((self.num_channel + 1), self._ring_size)
         f = self._file_data.acquire()
-        f.write('\x00' * shape[0] * shape[1] * self._dtype.itemsize)
+        f.write('\x00' * (
+            READER_STATE_SIZE + shape[0] * shape[1] * self._dtype.itemsize))
         f.flush()
 
-        # register memory-mapped-file as data buffer
+        # register memory-mapped-file as shared state and data buffer
         self._file_mmap = mmap.mmap(f.fileno(), 0)
+        self._state_bind(self._file_mmap)
         self._data = np.ndarray(
-            shape=shape, dtype=self._dtype, buffer=self._file_mmap)
+            shape=shape, dtype=self._dtype, buffer=self._file_mmap,
+            offset=READER_STATE_SIZE)
         # in case that restarted with smaller window_size
-        self._index = 0
+        self._state.seq = 0
+        self._lasti = [0] * 5
 
         if self._lsl_send:
             self._lsl_info = pylsl.StreamInfo(
@@ -333,11 +644,24 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
                 channel_count=self.num_channel, nominal_srate=self.sample_rate,
                 channel_format=self._dtype.name, source_id=self.name
             )
-            self._lsl_outlet = pylsl.StreamOutlet(self._lsl_info)
+            self._lsl_outlet = pylsl.StreamOutlet(
+                self._lsl_info, chunk_size=self._lsl_chunk)
+            self._lsl_buf = np.zeros(
+                (self._lsl_chunk, self.num_channel), self._dtype)
+            self._lsl_ts = np.zeros(self._lsl_chunk)
+            self._lsl_num = 0
+            # pylsl >= 1.16 accept timestamp of each sample by push_chunk_n
+            self._lsl_stamps = hasattr(self._lsl_outlet, 'do_push_chunk_n')
+            if not self._lsl_stamps:
+                logger.debug(self.name + ' pylsl outlet only accept one '
+                             'timestamp per chunk')
+            self._lsl_lock = self._lsl_flusher = None
             logger.debug(self.name + ' pylsl outlet established')
-            self._loop_args = (self._loop_func_lsl, )
+            self._loop_args = (self._chunk_fetch and self._loop_func_chunk_lsl
+                               or self._loop_func_lsl, )
         else:
-            self._loop_args = (self._loop_func, )
+            self._loop_args = (self._chunk_fetch and self._loop_func_chunk
+                               or self._loop_func, )
 
         self._loop_method = method or getattr(self, '_loop_method', 'process')
         if self._loop_method == 'block':
@@ -357,8 +681,15 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
     def close(self, *a, **k):
         if not LoopTaskMixin.close(self):
             return False
-        self._data = self._data.copy()  # remove reference to old data buffer
-        self._file_mmap.close()
+        self._data_notify()  # wake up blocked consumers
+        # remove reference to old data buffer and shared state
+        self._data = self._data.copy()
+        self._state_bind()
+        try:
+            self._file_mmap.close()
+        except BufferError:
+            # views of buffer are still used somewhere, leave it to GC
+            logger.debug(self.name + ' data buffer is still referenced')
         self._file_data.release()
         self._file_pid.release()
         logger.debug(self.name + ' stream stopped')
@@ -367,23 +698,215 @@ class BaseReader(LoopTaskMixin, ReaderIOMixin, CompatMixin, StatusMixin):
     def restart(self):
         self.close(); time.sleep(0.5); self.start()                # noqa: E702
 
+    def _state_bind(self, buf=None):
+        '''
+        Move shared state to the head of `buf`. A new anonymous shared memory
+        is created if `buf` is not provided. Current values are kept.
+        '''
+        if buf is None:
+            buf = mmap.mmap(-1, READER_STATE_SIZE)
+        state = ReaderState.from_buffer(buf)
+        if self._state is not None:
+            memmove(addressof(state), addressof(self._state),
+                    sizeof(ReaderState))
+        self._state = state
+
     def _loop_func_lsl(self):
         data, ts = self._data_fetch()
-        self._lsl_outlet.push_sample(data, ts)
+        self._lsl_push(np.reshape(data[:self.num_channel], (-1, 1)), (ts, ))
         self._data_save(data, ts)
 
     def _loop_func(self):
         data, ts = self._data_fetch()
         self._data_save(data, ts)
 
+    def _loop_func_chunk_lsl(self):
+        data, ts = self._data_fetch_chunk()
+        self._lsl_push(data[:self.num_channel], ts)
+        self._data_save_chunk(data, ts)
+
+    def _lsl_push(self, data, ts):
+        '''Buffer num_channel x n samples and push them to outlet by chunk.'''
+        if self._lsl_flusher is None:
+            # created in loop task's thread/process
+            self._lsl_lock = threading.Lock()
+            self._lsl_wake = threading.Event()
+            self._lsl_flusher = threading.Thread(target=self._lsl_timeout)
+            self._lsl_flusher.daemon = True
+            self._lsl_flusher.start()
+        n, i, size = len(ts), 0, self._lsl_chunk
+        with self._lsl_lock:
+            while i < n:
+                if not self._lsl_num:
+                    self._lsl_time = time.time()
+                    self._lsl_wake.set()
+                m = min(size - self._lsl_num, n - i)
+                j = self._lsl_num
+                self._lsl_buf[j:j + m] = data[:, i:i + m].T
+                self._lsl_ts[j:j + m] = ts[i:i + m]
+                self._lsl_num += m
+                i += m
+                if self._lsl_num == size:
+                    self._lsl_flush()
+            if self._lsl_num and (
+                    time.time() - self._lsl_time) >= self._lsl_latency:
+                self._lsl_flush()
+
+    def _lsl_timeout(self):
+        '''
+        Flush buffered samples once they have waited for `latency` seconds,
+        even if source stalls and no new chunk arrives.
+        '''
+        while self.started:
+            if not self._lsl_wake.wait(1):
+                continue
+            with self._lsl_lock:
+                if not self._lsl_num:
+                    self._lsl_wake.clear()
+                    continue
+                remain = self._lsl_time + self._lsl_latency - time.time()
+                if remain <= 0:
+                    self._lsl_flush()
+                    self._lsl_wake.clear()
+                    continue
+            time.sleep(remain)
+
+    def _lsl_flush(self):
+        n, self._lsl_num = self._lsl_num, 0
+        if self._lsl_stamps:
+            try:
+                return self._lsl_outlet.push_chunk(
+                    self._lsl_buf[:n], self._lsl_ts[:n].tolist())
+            except TypeError:
+                # timestamp list is not accepted by this pylsl
+                logger.warning('{} pylsl outlet rejects timestamp of each '
+                               'sample: {}'.format(self.name,
+                                                   traceback.format_exc()))
+                self._lsl_stamps = False
+        # only timestamp of the last sample, others are derived by srate
+        self._lsl_outlet.push_chunk(self._lsl_buf[:n], self._lsl_ts[n - 1])
+
+    def loop_after(self):
+        '''Push samples still buffered for pylsl outlet before loop ends.'''
+        if getattr(self, '_lsl_lock', None) is None:
+            return
+        with self._lsl_lock:
+            if self._lsl_num:
+                self._lsl_flush()
+
+    def _loop_func_chunk(self):
+        data, ts = self._data_fetch_chunk()
+        self._data_save_chunk(data, ts)
+
     def _data_fetch(self):
         raise NotImplementedError(self.name + ' cannot use this directly')
 
+    def _data_fetch_chunk(self):
+        '''
+        Fetch a block of samples at once. Readers whose source produce data
+        by blocks should override this method and set `_chunk_fetch = True`.
+
+        Returns
+        -------
+        data : ndarray
+            Array with a shape of num_channel x n
+        ts : ndarray
+            Timestamps of each sample with a shape of (n,)
+        '''
+        raise NotImplementedError(self.name + ' cannot use this directly')
+
     def _data_save(self, data, ts):
-        data = data[:self.num_channel]
-        self._data[:len(data), self._index] = data
-        self._data[-1, self._index] = ts
-        self._index = (self._index + 1) % self.window_size
+        data, state = data[:self.num_channel], self._state
+        seq = state.seq
+        idx = seq % state.ring_size
+        state.seqlock += 1
+        self._data[:len(data), idx] = data
+        self._data[-1, idx] = ts
+        state.seq = seq + 1
+        state.seqlock += 1
+        self._data_notify()
+
+    def _data_save_chunk(self, data, ts):
+        '''Write num_channel x n block into ring buffer with one update.'''
+        data, ts, state = data[:self.num_channel], np.asarray(ts), self._state
+        n, size = len(ts), state.ring_size
+        if not n:
+            return
+        seq = state.seq
+        if n > size:  # older samples will be overwritten immediately
+            data, ts, seq = data[:, -size:], ts[-size:], seq + n - size
+            n = size
+        i = seq % size
+        m = min(n, size - i)  # samples before wrapping around
+        state.seqlock += 1
+        self._data[:len(data), i:i + m] = data[:, :m]
+        self._data[-1, i:i + m] = ts[:m]
+        if m < n:
+            self._data[:len(data), :n - m] = data[:, m:]
+            self._data[-1, :n - m] = ts[m:]
+        state.seq = seq + n
+        state.seqlock += 1
+        self._data_notify()
+
+
+# =============================================================================
+# Binary frame used by socket readers
+#
+# Each frame carries a block of samples: a header followed by a payload of
+# num_channel x n float32 values in little-endian, channel by channel.
+# On stream sockets (TCP) each frame is preceded by its length as uint32.
+#     seq  uint32   frame sequence number, used to detect lost frames
+#     n    uint16   number of samples in this frame
+#     nch  uint16   number of channels
+#     ts   float64  timestamp of the first sample in seconds
+
+FRAME_HEADER = struct.Struct('<IHHd')
+FRAME_PREFIX = struct.Struct('<I')
+FRAME_DTYPE = np.dtype('<f4')
+
+
+def pack_frame(seq, data, ts, prefix=False):
+    '''
+    Pack num_channel x n block of samples into bytes of one frame. Set
+    `prefix` to True to prepend length of frame for stream sockets.
+    '''
+    data = np.asarray(data, FRAME_DTYPE)
+    nch, n = data.shape
+    frame = FRAME_HEADER.pack(seq & 0xFFFFFFFF, n, nch, ts) + data.tobytes()
+    if prefix:
+        return FRAME_PREFIX.pack(len(frame)) + frame
+    return frame
+
+
+def unpack_frame(buf):
+    '''
+    Parse one frame from bytes-like `buf`. Payload is not copied.
+
+    Returns
+    -------
+    seq : int
+    data : ndarray
+        Array with a shape of num_channel x n
+    ts : float
+        Timestamp of the first sample
+    '''
+    seq, n, nch, ts = FRAME_HEADER.unpack_from(buf)
+    data = np.frombuffer(buf, FRAME_DTYPE, nch * n, FRAME_HEADER.size)
+    return seq, data.reshape(nch, n), ts
+
+
+def _parse_address(address, default_host='0.0.0.0', default_port=0):
+    '''Parse "host:port" string or (host, port) tuple into a tuple.'''
+    if isinstance(address, (tuple, list)):
+        host, port = address
+    else:
+        host, _, port = ensure_unicode(address or '').partition(':')
+    host = (host or default_host).replace('localhost', '127.0.0.1')
+    socket.inet_aton(host)  # raise socket.error if host is invalid
+    port = int(port or default_port)
+    if not 0 <= port < 65536:
+        raise ValueError('Invalid port: %d' % port)
+    return host, port
 
 
 # =============================================================================
@@ -405,62 +928,138 @@ class FakeDataGenerator(BaseReader):
 
 
 class FilesReader(BaseReader):
-    '''Read data from file and simulate as a common data reader.'''
+    '''
+    Replay a data file as a common data reader. Supported formats are
+    MATLAB-style `.mat` (including chunked files saved by recorder), `.fif`,
+    numpy `.npy` and raw text `.csv`. Data of `.npy` files are memory-mapped
+    and `.fif` files are read lazily, so that only the block being replayed
+    is loaded into RAM, which is suitable for hours of recordings.
+
+    Data are streamed by blocks of `chunk_time` seconds and resampled to
+    `sample_rate` by polyphase filtering if the source has a different
+    sample rate. Timestamps are on the timeline of file, i.e. sample index
+    divided by `sample_rate`, no matter how fast it is replayed.
+    '''
+    _chunk_fetch = True
 
     def __init__(self, filename,
-                 sample_rate=250, sample_time=2, num_channel=1, **k):
-        if not os.path.exist(filename):
+                 sample_rate=250, sample_time=2, num_channel=1,
+                 speed=1, chunk_time=0.1, source_rate=None, **k):
+        '''
+        Parameters
+        ----------
+        speed : float
+            Replay speed relative to real time, e.g. 1 or 10. Set to 0 to
+            replay as fast as possible. Consumers may want a longer buffer
+            (see `history_seconds`) to keep up with fast replay.
+        chunk_time : float
+            Seconds of source data in each block.
+        source_rate : float, optional
+            Sample rate of data file if it's not recorded in file. Default
+            same as `sample_rate`.
+        '''
+        if not os.path.exists(filename):
             raise ValueError('Data file not exist: `%s`' % filename)
         k.setdefault('input_source', filename)
         k.setdefault('name', filename + '.Reader')
         super(FilesReader, self).__init__(
             sample_rate, sample_time, num_channel, **k)
+        self.speed = float(speed or 0)
+        self.chunk_time = float(chunk_time)
+        self.source_rate = source_rate
 
     def hook_before(self):
-        '''try to open data file and load data into RAM'''
+        '''Open data file and prepare the resampler.'''
         logger.debug(self.name + ' reading data file ' + self.input_source)
-        if self.input_source.endswith('.mat'):
-            actionname = os.path.basename(self.input_source).split('-')[0]
-            mat = scipy.io.loadmat(self.input_source)
-            data = mat[actionname][0]
-            sample_rate = mat.get('sample_rate', None)
-            logger.debug('{} load data with shape of {}@{}Hz'.format(
-                self.name, data.shape, sample_rate))
-            assert data.ndim == 2, 'Invalid data shape!'
-            n = data.shape[0]
-            if n < self.num_channel:
-                logger.info('{} change num_channel to {}'.format(
-                    self.name, n))
-                self.num_channel = n
-                self._data = self._data[:(n + 1)]
-            if sample_rate and sample_rate != self.sample_rate:
-                logger.warning('{} resample source data to {}Hz'.format(
-                    self.name, self.sample_rate))
-                raise NotImplementedError
-                data = scipy.signal.resample(data, self.sample_rate)
-            self._get_data = self._get_data_g(data.T)
-            self._get_data.next()
-        elif self.input_source.endswith('.fif'):
-            raise NotImplementedError
-        elif self.input_source.endswith('.csv'):
-            data = np.loadtxt(self.input_source, np.float32, delimiter=',')
-            self._get_data = self._get_data_g(data)
-            self._get_data.next()
+        self._file_read, nch, self._file_len, srate = self._file_open(
+            self.input_source)
+        srate = srate or self.source_rate or self.sample_rate
+        logger.debug('{} load data with shape of {}@{}Hz'.format(
+            self.name, (nch, self._file_len), srate))
+        # keep channel names consistent with buffer shape
+        self._check_num_channel(nch)
+        ratio = Fraction(self.sample_rate / float(srate)).limit_denominator(
+            1000)
+        up, down = self._file_ratio = ratio.numerator, ratio.denominator
+        if up != down:
+            logger.info('{} resample source data from {}Hz to {}Hz'.format(
+                self.name, srate, self.sample_rate))
+        # Blocks are aligned to `down` so that each block maps to a whole
+        # number of output samples. Blocks are padded by context on both
+        # sides longer than half of the filter used by `resample_poly`, so
+        # the result is the same as resampling the whole file at once.
+        step = max(1, int(self.chunk_time * srate))
+        self._file_step = -(-step // down) * down
+        self._file_pad = (-(-10 * max(up, down) // up) // down + 1) * down
+        self._file_pos = 0   # position in source samples
+        self._file_out = 0   # number of output samples
+        self._file_time = None
+
+    def _file_open(self, fn):
+        '''
+        Returns
+        -------
+        read : function
+            Called with (start, stop) to read num_channel x n source data.
+        num_channel : int
+        length : int
+        sample_rate : float or None
+        '''
+        srate = None
+        if fn.endswith('.fif') or fn.endswith('.fif.gz'):
+            raw = mne.io.read_raw_fif(fn, preload=False, verbose='ERROR')
+            return (lambda start, stop: raw.get_data(start=start, stop=stop),
+                    raw.info['nchan'], raw.n_times, raw.info['sfreq'])
+        elif fn.endswith('.npy'):
+            data = np.load(fn, mmap_mode='r')
+        elif fn.endswith('.csv'):
+            data = np.loadtxt(fn, np.float32, delimiter=',', ndmin=2).T
+        elif fn.endswith('.mat'):
+            mat = scipy.io.loadmat(fn)
+            actionname = os.path.basename(fn).split('-')[0]
+            if actionname in mat:  # legacy format
+                data = mat[actionname][0]
+            else:
+                mat = load_mat(mat)
+                data = mat[mat['key']]
+                if isinstance(data, (tuple, list)):  # chunked file
+                    data = np.concatenate(data, -1)
+            if 'sample_rate' in mat:
+                srate = float(np.ravel(mat['sample_rate'])[0])
         else:
-            raise NotImplementedError
-
-    def _get_data_g(self, data):
-        self._last_time = time.time()
-        d = 0.9 / self.sample_rate
-        for line in data:
-            while (time.time() - self._last_time) < d:
-                time.sleep(d / 2)
-            self._last_time = time.time()
-            if (yield line) == 'quit':
-                break
-
-    def _data_fetch(self):
-        return self._get_data.next(), time.time() - self.start_time
+            raise ValueError('Data file not support: `%s`' % fn)
+        if data.ndim != 2:
+            raise ValueError('Invalid data shape: {}'.format(data.shape))
+        return (lambda start, stop: data[:, start:stop],
+                data.shape[0], data.shape[1], srate)
+
+    def _data_fetch_chunk(self):
+        '''Read next block from file, resample it and pace by `speed`.'''
+        i, N = self._file_pos, self._file_len
+        if i >= N:
+            logger.info(self.name + ' reach the end of data file')
+            self.__flag_close__.set()
+            return np.zeros((self.num_channel, 0)), np.zeros(0)
+        j = min(i + self._file_step, N)
+        up, down = self._file_ratio
+        if up == down:
+            data = self._file_read(i, j)[:self.num_channel]
+        else:
+            s, e = max(0, i - self._file_pad), min(N, j + self._file_pad)
+            data = scipy.signal.resample_poly(
+                self._file_read(s, e)[:self.num_channel], up, down, axis=-1)
+            begin = (i - s) * up // down
+            data = data[:, begin:begin + (-(-j * up // down) - i * up // down)]
+        ts = (self._file_out + np.arange(data.shape[1])) / self.sample_rate
+        self._file_pos, self._file_out = j, self._file_out + len(ts)
+        if self.speed > 0 and len(ts):
+            if self._file_time is None:
+                self._file_time = time.time() - ts[0] / self.speed
+            # release the block when its last sample should be recorded
+            delay = self._file_time + ts[-1] / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return data, ts
 
 
 class LSLReader(BaseReader):
@@ -470,10 +1069,17 @@ class LSLReader(BaseReader):
     '''
     name = 'LSLReader'
 
-    def __init__(self, sample_rate=250, sample_time=2, num_channel=0, **k):
+    def __init__(self, sample_rate=250, sample_time=2, num_channel=0,
+                 chunk_size=0, **k):
+        '''
+        Set `chunk_size` to a positive number to pull samples by chunks into
+        a preallocated buffer instead of one by one.
+        '''
         k['send_pylsl'] = False
         super(LSLReader, self).__init__(
             sample_rate, sample_time, num_channel, **k)
+        self._chunk_size = int(chunk_size)
+        self._chunk_fetch = self._chunk_size > 0
 
     def start(self, *a, **k):
         '''
@@ -504,6 +1110,12 @@ class LSLReader(BaseReader):
         self._lsl_inlet = pylsl.StreamInlet(self._lsl_inlet_info, maxbuf)
         self.input_source = '{}@{}'.format(
             self._lsl_inlet_info.name(), self._lsl_inlet_info.source_id())
+        if self._chunk_fetch:
+            fmt = self._lsl_inlet_info.channel_format()
+            self._lsl_pull_buf = np.zeros(
+                (self._chunk_size, nch), pylsl.pylsl.fmt2string[fmt])
+            self._lsl_pull_timeout = (
+                self._chunk_size / fs if fs else 0.05)
 
     def hook_after(self):
         time.sleep(0.2)
@@ -517,17 +1129,48 @@ class LSLReader(BaseReader):
         #  return data, time.time() - self.start_time
         return data, ts + self._lsl_inlet.time_correction()
 
+    def _data_fetch_chunk(self):
+        '''Pull at most chunk_size samples into preallocated buffer.'''
+        _, ts = self._lsl_inlet.pull_chunk(
+            self._lsl_pull_timeout, self._chunk_size, self._lsl_pull_buf)
+        n = len(ts)
+        if n:
+            ts = np.array(ts) + self._lsl_inlet.time_correction()
+        return self._lsl_pull_buf[:n].T, np.asarray(ts)
+
 
 class SerialReader(BaseReader):
     '''
     Connect to a serial port and fetch data into buffer.
     There should be at least one port available.
+
+    Bytes are read by blocks and all samples in them are parsed at once.
+    Two protocols are supported:
+        - text: one sample per line, values are separated by `delimiter`
+        - binary: one sample per frame, which consists of
+            sync      2 bytes  0xA5 0x5A
+            length    uint8    number of bytes of payload
+            payload   num_channel values of `frame_dtype`
+            checksum  uint8    sum of payload bytes & 0xFF
     '''
     name = 'SerialReader'
+    _chunk_fetch = True
+    # Max seconds to wait for a complete line to detect number of channels
+    probe_timeout = 3
 
-    def __init__(self, sample_rate=250, sample_time=2, num_channel=1, **k):
+    # Frame counters shared among processes, written by loop task only
+    frames_recv = _state_property('frames_recv')
+    frames_bad  = _state_property('frames_bad')                    # noqa: E221
+
+    def __init__(self, sample_rate=250, sample_time=2, num_channel=1,
+                 protocol='text', delimiter=',', frame_dtype='<f4', **k):
+        if protocol not in ['text', 'binary']:
+            raise ValueError('Invalid protocol: `%s`' % protocol)
         super(SerialReader, self).__init__(
             sample_rate, sample_time, num_channel, **k)
+        self.protocol = protocol
+        self._delimiter = ensure_bytes(delimiter)
+        self._frame_dtype = np.dtype(frame_dtype)
         self._serial = serial.Serial()
 
     def start(self, port=None, baudrate=115200, *a, **k):
@@ -535,32 +1178,136 @@ class SerialReader(BaseReader):
             return self.resume()
         self._serial.port = port or find_serial_ports()
         self._serial.baudrate = baudrate
+        self._serial.timeout = 0.1
         return super(SerialReader, self).start(**k)
 
     def hook_before(self):
         self._serial.open()
         self.input_source = 'Serial@{}'.format(self._serial.port)
         logger.debug(self.name + ' `%s` opened.' % self.input_source)
-        self._check_num_channel(len(self._data_fetch()[0]))
+        self._serial_buf = b''
+        self._state.frames_recv = self._state.frames_bad = 0
+        if self.protocol == 'text':
+            line = self._probe_line()
+            if line is None:
+                logger.warning(
+                    '{} no complete line received from `{}` in {} seconds, '
+                    'assume {} channels'.format(
+                        self.name, self.input_source, self.probe_timeout,
+                        self.num_channel))
+            else:
+                self._check_num_channel(
+                    len(line.replace(self._delimiter, b' ').split()))
+
+    def _probe_line(self):
+        '''
+        Return the first complete non-empty line read from serial port in
+        `probe_timeout` seconds, or None. The first line received is
+        skipped because it may start in the middle.
+        '''
+        deadline = time.time() + self.probe_timeout
+        buf, skip = b'', True
+        while time.time() < deadline:
+            buf += self._serial.readline()
+            if not buf.endswith(b'\n'):
+                continue
+            line, buf = buf, b''
+            if skip:
+                skip = False
+            elif line.replace(self._delimiter, b' ').split():
+                return line
 
     def hook_after(self):
         self._serial.close()
 
-    def _data_fetch(self):
-        #  data = self._serial.read_until().decode('utf-8')
-        #  data = [i.strip() for i in data.split(',')]
-        #  data = np.array([float(i) for i in data if i], self._dtype)
-        data = np.loadtxt(self._serial, self._dtype, delimiter='.')
-        return data, time.time() - self.start_time
+    def _data_fetch_chunk(self):
+        buf = self._serial_buf + self._serial.read(
+            max(1, self._serial.in_waiting))
+        if self.protocol == 'binary':
+            data, used = self._parse_binary(buf)
+        else:
+            data, used = self._parse_text(buf)
+        self._serial_buf = buf[used:]
+        n = data.shape[1]
+        # samples in one block are assumed to be evenly spaced
+        ts = time.time() - self.start_time - (
+            np.arange(n - 1, -1, -1) / self.sample_rate)
+        return data, ts
+
+    def _parse_binary(self, buf):
+        '''
+        Find all valid frames in `buf` by vectorized searching of sync bytes
+        and checksum. Return num_channel x n data and bytes consumed.
+        '''
+        L = self.num_channel * self._frame_dtype.itemsize
+        F = L + 4
+        raw = np.frombuffer(buf, np.uint8)
+        n = len(raw) - F + 1  # frames can start before here
+        if n <= 0:
+            return np.zeros((self.num_channel, 0)), 0
+        cand = np.flatnonzero(
+            (raw[:n] == 0xA5) & (raw[1:n + 1] == 0x5A) & (raw[2:n + 2] == L))
+        payload = raw[cand[:, None] + np.arange(3, 3 + L)]
+        ok = (payload.sum(1, dtype=np.uint32) & 0xFF) == raw[cand + 3 + L]
+        good = cand[ok]
+        if (np.diff(good) < F).any():
+            # sync bytes inside payload passed checksum, pick by order
+            keep, last = [], -F
+            for c in good:
+                if c >= last + F:
+                    keep.append(c)
+                    last = c
+            ok[np.searchsorted(cand, np.setdiff1d(good, keep))] = False
+            good = cand[ok]
+        self._state.frames_recv += len(good)
+        self._state.frames_bad += len(cand) - len(good)
+        data = payload[ok].view(self._frame_dtype).T
+        return data, max(good[-1] + F if len(good) else 0, n)
+
+    def _parse_text(self, buf):
+        '''
+        Parse all complete lines in `buf` at once. Return num_channel x n
+        data and bytes consumed.
+        '''
+        end = buf.rfind(b'\n') + 1
+        if not end:
+            # drop garbage if no line break is found for a long time
+            return np.zeros((self.num_channel, 0)), max(0, len(buf) - 4096)
+        lines = buf[:end].replace(self._delimiter, b' ').split(b'\n')
+        lines = [line for line in lines if line.strip()]
+        values = b' '.join(lines).split()
+        try:
+            assert len(values) == len(lines) * self.num_channel
+            data = np.array(values).astype(self._dtype)
+        except (AssertionError, ValueError):
+            # slow path: parse line by line and skip broken lines
+            rows = []
+            for line in lines:
+                try:
+                    row = np.array(line.split()).astype(self._dtype)
+                    assert len(row) == self.num_channel
+                except (AssertionError, ValueError):
+                    self._state.frames_bad += 1
+                else:
+                    rows.append(row)
+            data = np.array(rows, self._dtype)
+        data = data.reshape(-1, self.num_channel).T
+        self._state.frames_recv += data.shape[1]
+        return data, end
 
 
 class ADS1299SPIReader(BaseReader, Singleton):
     '''
     Read data through SPI connection with ADS1299.
     This Reader is only used on ARM. It depends on class ADS1299_API.
+
+    Only enabled channels are acquired. Data buffer and pylsl outlet shrink
+    to enabled channels (at most `num_channel`) and `channels` are renamed
+    after them, e.g. ['ch1', 'ch3', 'time'] if ch2 is powered down.
     '''
     API = ADS1299_API
     name = 'ADS1299Reader'
+    _chunk_fetch = True
 
     def __init__(self, sample_rate=250, sample_time=2, num_channel=1,
                  measure_impedance=False, enable_bias=True, API=None, **k):
@@ -568,6 +1315,7 @@ class ADS1299SPIReader(BaseReader, Singleton):
         k.setdefault('input_source', 'normal')
         super(ADS1299SPIReader, self).__init__(
             sample_rate, sample_time, num_channel, **k)
+        self._num_channel_max = self.num_channel
         self.enable_bias = enable_bias
         self.measure_impedance = measure_impedance
 
@@ -577,6 +1325,9 @@ class ADS1299SPIReader(BaseReader, Singleton):
             return False
         logger.debug('{} channel {} {}'.format(
             self.name, ch, 'enabled' if en else 'disabled'))
+        if self.started:
+            # re-allocate data buffer and outlet with enabled channels
+            self.restart()
         return True
 
     @property
@@ -605,28 +1356,37 @@ class ADS1299SPIReader(BaseReader, Singleton):
 
     @property
     def input_source(self):
-        return ensure_unicode(self._mp_input_source.value)
+        return BaseReader.input_source.fget(self)
 
     @input_source.setter
     def input_source(self, src):
         if self._api.set_input_source(src) is None:
             logger.error(self.name + ' invalid input source {}'.format(src))
             return False
-        self._mp_input_source.value = ensure_bytes(src)
+        BaseReader.input_source.fset(self, src)
         logger.info(self.name + ' input source set to {}'.format(src))
         return True
 
     def start(self, device=None, *a, **k):
         if self.started:
             return self.resume()
-        self._api._dev = device and tuple(device) or find_spi_devices()
+        if device:
+            self._api._dev = tuple(device)
+        elif not getattr(self._api, '_dev', None):  # keep it when restarted
+            self._api._dev = find_spi_devices()
         return super(ADS1299SPIReader, self).start(**k)
 
     def hook_before(self):
         self._api.open(self._api._dev)
         self._api.start(self.sample_rate)
         logger.info(self.name + ' `/dev/spidev%d-%d` opened.' % self._api._dev)
-        #  self._check_num_channel()
+        channels = np.flatnonzero(self._api.channel_mask)
+        channels = channels[:self._num_channel_max]
+        if len(channels) != self.num_channel:
+            logger.info('{} change num_channel to {}'.format(
+                self.name, len(channels)))
+            self.num_channel = len(channels)
+        self.channels = ['ch%d' % (i + 1) for i in channels] + ['time']
 
     def hook_after(self):
         self._api.close()
@@ -634,6 +1394,10 @@ class ADS1299SPIReader(BaseReader, Singleton):
     def _data_fetch(self):
         return self._api.read()
 
+    def _data_fetch_chunk(self):
+        # drain about 20ms samples in each loop
+        return self._api.read_chunk(max(1, self.sample_rate // 50))
+
 
 class ESP32SPIReader(ADS1299SPIReader):
     '''
@@ -643,20 +1407,69 @@ class ESP32SPIReader(ADS1299SPIReader):
     API = ESP32_API
     name = 'ESP32Reader'
 
+    def _data_fetch_chunk(self):
+        return self._api.read_chunk()
+
 
 class SocketTCPReader(BaseReader):
     '''
-    A reader that recieve data from specific host and port through TCP socket.
+    Socket TCP client, data receiver. Connect to a server at `address` and
+    receive frames packed by `pack_frame(..., prefix=True)`, i.e. each frame
+    is preceded by its length, as `SocketTCPServer.multicast_frame` sends
+    them. Bytes are received into a preallocated buffer
+    and all complete frames are decoded as one block.
+
+    Timestamps of frames are on the sender's clock. They are shifted by a
+    constant offset so that the first frame matches local arrival time.
+    Lost, late and malformed frames are counted by `frames_lost` and
+    `frames_bad`.
     '''
     name = 'SocketTCPReader'
+    _chunk_fetch = True
 
-    def __init__(self, sample_rate=250, sample_time=2, num_channel=1, **k):
+    # Frame counters shared among processes, written by loop task only
+    frames_recv = _state_property('frames_recv')
+    frames_lost = _state_property('frames_lost')
+    frames_bad  = _state_property('frames_bad')                    # noqa: E221
+
+    def __init__(self, sample_rate=250, sample_time=2, num_channel=1,
+                 address=None, bufsize=1 << 20, timeout=0.5, **k):
+        '''
+        Parameters
+        ----------
+        address : str | tuple, optional
+            Server address, "host:port" or (host, port). User will be asked
+            to input one if not provided here or by `start`.
+        bufsize : int
+            Size of receiving buffer in bytes, must be larger than a frame.
+        timeout : float
+            Seconds to wait for data in one loop.
+        '''
         super(SocketTCPReader, self).__init__(
             sample_rate, sample_time, num_channel, **k)
-        self._client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.address = address
+        self._bufsize = int(bufsize)
+        self._timeout = float(timeout)
+
+    def start(self, address=None, *a, **k):
+        if address is not None:
+            self.address = address
+        return super(SocketTCPReader, self).start(*a, **k)
 
     def hook_before(self):
-        # IP addr and port are offered by user, connect to host:port
+        if self.address is None:
+            self.address = self._input_address()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.connect(_parse_address(self.address, default_port=80))
+        self.address = self._sock.getpeername()
+        self.input_source = 'tcp://{}:{}'.format(*self.address)
+        self._tcp_buf = bytearray(self._bufsize)
+        self._tcp_view = memoryview(self._tcp_buf)
+        self._tcp_len = self._tcp_head = 0
+        self._frame_reset()
+
+    def _input_address(self):
+        '''Ask user for an address "host:port" interactively.'''
         logger.debug(self.name + ' configure IP address')
         extra = ''
         for i in range(5):
@@ -664,34 +1477,16 @@ class SocketTCPReader(BaseReader):
                 extra + 'Please input an address "host:port".\n'
                 'Type `quit` to abort.\n'
                 '> 192.168.0.1:8888 (example)\n> '
-            ), {}).replace('localhost', '127.0.0.1')
-            extra = ''
+            ), {})
             if rst in ['quit', '']:
                 raise RuntimeError(self.name + ' manual exit.')
             try:
-                if ':' not in rst:
-                    host, port = rst, 80
-                else:
-                    host, port = rst.split(':')
-                socket.inet_aton(host)  # check if host is valid string
-                port = int(port)
-                assert port > 0
+                return _parse_address(rst, default_port=80)
             except socket.error:
-                extra = self.name + ' Invalid host: `%s`\n' % host
-                continue
-            except (ValueError, AssertionError):
-                extra = self.name + ' Invalid port: `%s`\n' % port
-                continue
-            else:
-                break
-        else:
-            raise RuntimeError(self.name + ' five times failed.')
-        # TCP IPv4 socket connection
-        self._client.connect((host, port))
-        self._client_size = 512 * self._dtype.itemsize
-        self.input_source = '{}:{}'.format(host, port)
-        self._check_num_channel(len(self._data_fetch()[0]))
-        self._client_size = self.num_channel * self._dtype.itemsize
+                extra = self.name + ' Invalid host: `%s`\n' % rst
+            except ValueError:
+                extra = self.name + ' Invalid port: `%s`\n' % rst
+        raise RuntimeError(self.name + ' five times failed.')
 
     def hook_after(self):
         '''
@@ -700,28 +1495,265 @@ class SocketTCPReader(BaseReader):
         client may be blocking that process/thread by client.recv(n). We need
         to let server socket close the connection.
         '''
-        self._client.send('shutdown')
         try:
-            self._client.shutdown(socket.SHUT_RDWR)
-            self._client.close()
+            self._sock.send(b'shutdown')
+            self._sock.shutdown(socket.SHUT_RDWR)
+            self._sock.close()
         except socket.error:
             pass
 
-    def _data_fetch(self):
-        data = self._client.recv(self._client_size)
-        return np.frombuffer(data, self._dtype), time.time() - self.start_time
+    def _frame_reset(self):
+        self._frame_seq = None
+        self._frame_offset = None
+        state = self._state
+        state.frames_recv = state.frames_lost = state.frames_bad = 0
+
+    def _frame_collect(self, frames):
+        '''
+        Check sequence numbers of decoded frames and stack their samples into
+        one num_channel x n block. Timestamps are shifted to local clock.
+        '''
+        state, blocks, stamps = self._state, [], []
+        for seq, data, t0 in frames:
+            if data.shape[0] != self.num_channel:
+                state.frames_bad += 1
+                continue
+            if self._frame_seq is not None:
+                gap = (seq - self._frame_seq - 1) & 0xFFFFFFFF
+                if gap & 0x80000000:  # late or duplicated frame
+                    state.frames_bad += 1
+                    continue
+                state.frames_lost += gap
+            self._frame_seq = seq
+            state.frames_recv += 1
+            blocks.append(data)
+            stamps.append(t0 + np.arange(data.shape[1]) / self.sample_rate)
+        if not blocks:
+            return np.zeros((self.num_channel, 0), FRAME_DTYPE), np.zeros(0)
+        if self._frame_offset is None:
+            self._frame_offset = stamps[0][0] - (
+                time.time() - self.start_time)
+        ts = np.concatenate(stamps) - self._frame_offset
+        if len(blocks) == 1:
+            # payload view of receiving buffer is decoded by `frombuffer` and
+            # written into ring buffer by `_data_save_chunk` without a copy
+            return blocks[0], ts
+        return np.concatenate(blocks, -1), ts
+
+    def _data_fetch_chunk(self):
+        '''Receive bytes into buffer and decode all complete frames.'''
+        buf, view, end = self._tcp_buf, self._tcp_view, self._tcp_len
+        if self._tcp_head:
+            # move incomplete frame left by last loop to the head of buffer
+            buf[:end - self._tcp_head] = buf[self._tcp_head:end]
+            end -= self._tcp_head
+            self._tcp_head = 0
+        if select.select([self._sock], [], [], self._timeout)[0]:
+            n = self._sock.recv_into(view[end:])
+            if not n:
+                raise RuntimeError(self.name + ' connection closed')
+            end += n
+        frames, i = [], 0
+        while end - i >= FRAME_PREFIX.size:
+            size, = FRAME_PREFIX.unpack_from(buf, i)
+            if size + FRAME_PREFIX.size > len(buf):
+                raise RuntimeError('{} invalid frame size {}'.format(
+                    self.name, size))
+            j = i + FRAME_PREFIX.size + size
+            if j > end:
+                break
+            try:
+                frames.append(unpack_frame(view[j - size:j]))
+            except (struct.error, ValueError):
+                self._state.frames_bad += 1
+            i = j
+        # frames are still referenced by returned data until it is saved
+        self._tcp_head, self._tcp_len = i, end
+        return self._frame_collect(frames)
 
 
 class SocketUDPReader(SocketTCPReader):
-    '''Socket UDP client, data receiver. Under development.'''
+    '''
+    Socket UDP server, data receiver. Senders push frames packed by
+    `pack_frame` to the address this reader is bound to. Datagrams are
+    received by batches and decoded into the buffer as one block.
+
+    Examples
+    --------
+    >>> reader = SocketUDPReader(500, 2, 8, address='0.0.0.0:9999')
+    >>> reader.start()
+    >>> sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    >>> sock.sendto(pack_frame(0, data, time.time()), ('127.0.0.1', 9999))
+    >>> reader.frames_recv, reader.frames_lost, reader.frames_bad
+    (1, 0, 0)
+    '''
     name = 'SocketUDPReader'
 
-    def __init__(self, sample_rate=250, sample_time=2, num_channel=1, **k):
-        # sample_rate, sample_time, num_channel, name=None
-        # input_source=None, send_pylsl=False, datatype=None
+    def __init__(self, sample_rate=250, sample_time=2, num_channel=1,
+                 address=None, batch=16, timeout=0.5, **k):
+        '''
+        Parameters
+        ----------
+        address : str | tuple, optional
+            Local address to bind, "host:port" or (host, port). Default
+            "0.0.0.0:0", i.e. a random port on all interfaces.
+        batch : int
+            Max number of datagrams received in one loop.
+        timeout : float
+            Seconds to wait for the first datagram in one loop.
+        '''
         super(SocketUDPReader, self).__init__(
-            sample_rate, sample_time, num_channel, **k)
-        raise NotImplementedError
+            sample_rate, sample_time, num_channel, address,
+            timeout=timeout, **k)
+        self._batch = max(1, int(batch))
+
+    def hook_before(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(_parse_address(self.address))
+        self._sock.setblocking(False)
+        self.address = self._sock.getsockname()
+        self.input_source = 'udp://{}:{}'.format(*self.address)
+        # Preallocated slots for datagrams, one bytearray for the batch
+        size = 65536
+        self._udp_buf = bytearray(size * self._batch)
+        self._udp_views = [
+            memoryview(self._udp_buf)[i * size:(i + 1) * size]
+            for i in range(self._batch)]
+        self._frame_reset()
+
+    def hook_after(self):
+        try:
+            self._sock.close()
+        except socket.error:
+            pass
+
+    def _data_fetch_chunk(self):
+        '''Receive a batch of datagrams like `recvmmsg` and decode them.'''
+        sizes = []
+        if select.select([self._sock], [], [], self._timeout)[0]:
+            for view in self._udp_views:
+                try:
+                    sizes.append(self._sock.recv_into(view))
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    raise
+        frames = []
+        for view, size in zip(self._udp_views, sizes):
+            try:
+                frames.append(unpack_frame(view[:size]))
+            except (struct.error, ValueError):
+                self._state.frames_bad += 1
+        return self._frame_collect(frames)
+
+
+class MergedReader(BaseReader):
+    '''
+    Fan-in of several readers. Samples of each source are aligned onto one
+    common timeline by their time channel and linearly interpolated at
+    `sample_rate`, so that consumers see one combined buffer with channels
+    of all sources stacked in order.
+
+    Source readers should be started before this reader so that their
+    buffers are shared with the merging task, and their timestamps must be
+    on the same clock (e.g. `time.time() - start_time`). Readers fetching
+    data from LSL inlets use pylsl's local clock and can not be mixed with
+    other readers.
+
+    Examples
+    --------
+    >>> eeg = ESP32SPIReader(500, 4, 8); eeg.start()
+    >>> emg = SerialReader(1000, 4, 2); emg.start('/dev/ttyS1')
+    >>> reader = MergedReader([eeg, emg], sample_rate=500)
+    >>> reader.start()
+    >>> reader.data_frame.shape  # 8 + 2 channels and time channel
+    (11, 2000)
+    '''
+    name = 'MergedReader'
+    _chunk_fetch = True
+
+    def __init__(self, readers, sample_rate=None, sample_time=None,
+                 timeout=0.5, **k):
+        '''
+        Parameters
+        ----------
+        readers : list of BaseReader
+        sample_rate : int, optional
+            Rate of common timeline. Default highest rate of sources.
+        sample_time : float, optional
+            Default longest sample_time of sources.
+        timeout : float
+            Seconds to wait for each source in every loop.
+        '''
+        if not readers:
+            raise ValueError('At least one reader is required')
+        self._readers = list(readers)
+        self._timeout = float(timeout)
+        k.setdefault('input_source', ' + '.join(
+            r.name for r in self._readers))
+        super(MergedReader, self).__init__(
+            sample_rate or max(r.sample_rate for r in self._readers),
+            sample_time or max(r.sample_time for r in self._readers),
+            sum(r.num_channel for r in self._readers), **k)
+
+    def start(self, *a, **k):
+        for reader in self._readers:
+            if not reader.started:
+                reader.start()
+        return super(MergedReader, self).start(*a, **k)
+
+    def hook_before(self):
+        self._cursors = [r.ring_seq for r in self._readers]
+        # Samples of sources that are not interpolated yet. The last sample
+        # before next point of timeline is kept for interpolation.
+        self._pending = [
+            np.zeros((r.num_channel + 1, 0), np.float64)
+            for r in self._readers]
+        self._t_next = None  # absolute time of next point on timeline
+
+    def _data_fetch_chunk(self):
+        t_end = None
+        for i, reader in enumerate(self._readers):
+            reader.wait_for_samples(
+                1, self._timeout, cursor=self._cursors[i])
+            data, self._cursors[i] = reader.data_since(self._cursors[i])
+            if data.shape[1]:
+                data = data.astype(np.float64)
+                data[-1] += reader.start_time
+                self._pending[i] = np.concatenate(
+                    (self._pending[i], data), -1)[:, -reader._ring_size:]
+            if not self._pending[i].shape[1]:
+                return np.zeros((self.num_channel, 0)), np.zeros(0)
+            t_last = self._pending[i][-1, -1]
+            t_end = t_last if t_end is None else min(t_end, t_last)
+        if self._t_next is None:
+            self._t_next = max(p[-1, 0] for p in self._pending)
+        # interpolate only inside the range covered by all sources
+        n = int(np.floor((t_end - self._t_next) * self.sample_rate)) + 1
+        if n <= 0:
+            return np.zeros((self.num_channel, 0)), np.zeros(0)
+        ts = self._t_next + np.arange(n) / self.sample_rate
+        self._t_next = ts[-1] + 1.0 / self.sample_rate
+        data = np.concatenate([
+            self._data_align(i, ts) for i in range(len(self._readers))])
+        return data, ts - self.start_time
+
+    def _data_align(self, i, ts):
+        '''Interpolate pending samples of source `i` at timestamps `ts`.'''
+        pending = self._pending[i]
+        t = pending[-1]
+        # index of the right neighbour of each timestamp
+        right = np.clip(np.searchsorted(t, ts, 'right'), 1, len(t) - 1)
+        left = right - 1
+        if len(t) > 1:
+            dt = t[right] - t[left]
+            w = np.clip(
+                (ts - t[left]) / np.where(dt > 0, dt, 1), 0, 1)
+        else:
+            right, w = left, np.zeros(len(ts))
+        data = pending[:-1, left] * (1 - w) + pending[:-1, right] * w
+        self._pending[i] = pending[:, max(0, right[-1] - 1):]
+        return data
 
 
 # THE END
@@ -22,7 +22,7 @@ from decorator import decorator
 from . import timed, freqd
 from ..io.readers import BaseReader
 
-__all__ = ['SignalInfo', 'Features']
+__all__ = ['SignalInfo', 'StreamingFilter', 'Features']
 
 
 @decorator
@@ -85,10 +85,8 @@ class SignalInfo(object):
         self.std = self.standard_deviation
         self.cov = self.covariance
 
-        # filter state
-        self._b = {}
-        self._a = {}
-        self._zi = {}
+        # online filters
+        self._filters = {}
 
     @check_shape
     def average(self, X):
@@ -186,21 +184,20 @@ class SignalInfo(object):
         b, a = scipy.signal.butter(order, (low / nyq, high / nyq), 'band')
         if register:
             # store params for real-time filtering
-            zi = scipy.signal.lfilter_zi(b, a) * np.average(np.abs(X))
-            self._b['band'], self._a['band'], self._zi['band'] = b, a, zi
+            self._filters['band'] = StreamingFilter(
+                sample_rate or self.sample_rate,
+                bandpass=(low, high), order=order)
         return scipy.signal.lfilter(b, a, X)
 
     def bandpass_realtime(self, x):
         '''
-        sample_rate, b, a, and low/high param are all registed by calling
-        `SignalInfo.bandpass(X, low, high, order, sample_rate)` and
-        will be updated by recalling `Bandpass_Filter`
+        sample_rate, low/high and order param are all registed by calling
+        `SignalInfo.bandpass(X, low, high, order, sample_rate, True)`.
+        Input `x` can be one sample of each channel or a block of data with
+        shape n_channel x n_sample. See `StreamingFilter` for more info.
         '''
-        assert self._b.get('band') is not None, 'call `bandpass` first!'
-        x, self._zi['band'] = scipy.signal.lfilter(
-            self._b['band'], self._a['band'],
-            np.atleast_1d(x), zi=self._zi['band'])
-        return x
+        assert 'band' in self._filters, 'call `bandpass` first!'
+        return self._filters['band'].process(x)
 
     @check_shape
     def notch(self, X, Hz=50, Q=100, sample_rate=None, register=False):
@@ -213,15 +210,10 @@ class SignalInfo(object):
         '''
         nyq = float(sample_rate or self.sample_rate) / 2
         if register:
-            self._b['notch'], self._a['notch'], self._zi['notch'] = [], [], []
+            self._filters['notch'] = StreamingFilter(
+                sample_rate or self.sample_rate, notch=Hz, Q=Q)
         for b, a in [scipy.signal.iirnotch(freq / nyq, Q)
                      for freq in np.arange(Hz, nyq, Hz)]:
-            if register:
-                # save params
-                self._b['notch'].append(b)
-                self._a['notch'].append(a)
-                self._zi['notch'].append(
-                    scipy.signal.lfilter_zi(b, a) * np.average(np.abs(X)))
             # convolve filter with data
             X = scipy.signal.lfilter(b, a, X, axis=-1)
         return X
@@ -231,13 +223,8 @@ class SignalInfo(object):
         Realtime online notch filter,
         Refer to `bandpass_realtime` for more info.
         '''
-        assert self._b.get('notch') is not None, 'call `notch` first!'
-        zis, self._zi['notch'] = self._zi['notch'], []
-        x = np.atleast_1d(x)
-        for b, a, zi in zip(self._b['notch'], self._a['notch'], zis):
-            x, zi = scipy.signal.lfilter(b, a, x, zi=zi)
-            self._zi['notch'].append(zi)
-        return x
+        assert 'notch' in self._filters, 'call `notch` first!'
+        return self._filters['notch'].process(x)
 
     @check_shape
     @copy_doc(freqd.autocorrelation)
@@ -316,6 +303,121 @@ class SignalInfo(object):
         return timed.synclike(X)
 
 
+class StreamingFilter(object):
+    '''
+    Stateful filter bank for online (block by block) filtering.
+
+    Notch filters at `notch` Hz and its harmonics below Nyquist frequency
+    and a Butterworth bandpass filter are cascaded into one array of
+    second-order sections, so that a block of data is filtered by a single
+    `scipy.signal.sosfilt` call. Each channel has its own filter state,
+    which is continued from block to block.
+
+    Examples
+    --------
+    >>> sf = StreamingFilter(500, notch=50, bandpass=(4, 40))
+    >>> for block in blocks:  # n_channel x n_sample, n_sample can vary
+    ...     block = sf.process(block)
+    '''
+    def __init__(self, sample_rate=None, notch=None, bandpass=None,
+                 Q=100, order=5):
+        self.sos = self.zi = self._params = None
+        self._pending = None  # mask of channels to reset by next block
+        self.sample_rate, self.notch, self.bandpass = None, None, None
+        self.Q, self.order = Q, order
+        if sample_rate:
+            self.design(sample_rate, notch, bandpass)
+
+    def design(self, sample_rate, notch=None, bandpass=None,
+               Q=None, order=None):
+        '''
+        Compute second-order sections of filters. Filter state is reset
+        unless all parameters are the same as last design.
+
+        Parameters
+        ----------
+        sample_rate : number
+            In Hz unit.
+        notch : number, optional
+            Base frequency to be notched. Set to None to disable notch.
+        bandpass : tuple, optional
+            Low and high cut-off frequency. None to disable bandpass.
+        Q : number, optional
+            Quality factor of notch filters.
+        order : int, optional
+            Order of Butterworth bandpass filter.
+        '''
+        params = (sample_rate, notch or None,
+                  tuple(bandpass) if bandpass else None,
+                  Q or self.Q, order or self.order)
+        if params == self._params:
+            return self
+        (self.sample_rate, self.notch, self.bandpass,
+         self.Q, self.order) = self._params = params
+        nyq = float(sample_rate) / 2
+        sections = []
+        if self.notch:
+            for freq in np.arange(self.notch, nyq, self.notch):
+                b, a = scipy.signal.iirnotch(freq / nyq, self.Q)
+                sections.append(scipy.signal.tf2sos(b, a))
+        if self.bandpass:
+            low, high = self.bandpass
+            sections.append(scipy.signal.butter(
+                self.order, (low / nyq, high / nyq), 'band', output='sos'))
+        self.sos = np.vstack(sections) if sections else None
+        self.zi = self._pending = None
+        return self
+
+    def reset(self, x0=None, channel=None):
+        '''
+        Reset filter state. If `x0` (one sample of each channel) is given,
+        state is set to the steady state of constant input `x0`. Otherwise
+        state will be initialized by first sample of next block.
+        Use `channel` (index, list or mask) to only reset some of channels,
+        then `x0` can also be samples of these channels only.
+        '''
+        if self.sos is None or channel is None:
+            self.zi = self._pending = None
+            if self.sos is not None and x0 is not None:
+                x0 = np.atleast_1d(x0).astype(float)
+                self.zi = self._steady(x0)  # n_section x n_channel x 2
+            return
+        if self.zi is None:  # all channels will be initialized anyway
+            return
+        index = np.atleast_1d(np.arange(self.zi.shape[1])[channel])
+        if x0 is None:
+            if self._pending is None:
+                self._pending = np.zeros(self.zi.shape[1], bool)
+            self._pending[index] = True
+            return
+        x0 = np.atleast_1d(x0).astype(float)
+        if len(x0) == self.zi.shape[1]:
+            x0 = x0[index]
+        self.zi[:, index] = self._steady(np.broadcast_to(x0, index.shape))
+
+    def _steady(self, x0):
+        return scipy.signal.sosfilt_zi(self.sos)[:, None, :] * x0[:, None]
+
+    def process(self, X):
+        '''
+        Filter a block of data with shape n_channel x n_sample. One sample
+        of each channel with shape (n_channel, ) is also accepted. Filtered
+        data is returned with the same shape as input.
+        '''
+        if self.sos is None:
+            return X
+        X = np.asarray(X, dtype=float)
+        block = X.reshape(-1, 1) if X.ndim < 2 else X
+        if self.zi is None or self.zi.shape[1] != block.shape[0]:
+            self.reset(block[:, 0])
+        elif self._pending is not None:
+            self.reset(block[:, 0], self._pending)
+            self._pending = None
+        block, self.zi = scipy.signal.sosfilt(
+            self.sos, block, axis=-1, zi=self.zi)
+        return block.reshape(X.shape)
+
+
 def preprocess(*methods):
     '''
     This is a decorator factory used to register preprocessing methods
@@ -12,7 +12,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import os
+import json
 import time
+import struct
 import select
 import logging
 import warnings
@@ -30,7 +32,9 @@ from decorator import decorator
 
 from ..configs import DIR_SRC
 from ..io import SerialCommander
-from ..drivers.ili9341 import ILI9341_API, rgb565to888, rgb888to565
+from ..drivers.ili9341 import (
+    ILI9341_API, rgb565to888, rgb888to565, rgb888to565_array
+)
 from ..utils import (
     timestamp, find_gui_layouts, ensure_unicode,
     get_config, serialize, deserialize, get_func_args,
@@ -75,9 +79,165 @@ def DEFAULT_COLOR():
     })
 
 
+# ===============================================================================
+# Binary layout file
+#
+# header | JSON element list | padding | data blocks
+#
+# Each element in JSON list is [name, attributes, arrays, extra], where arrays
+# maps attribute name to [offset, shape, dtype] of a raw data block and extra
+# is [offset, length] of dill serialized attributes that are not JSON-able,
+# e.g. button callbacks. Methods of the GUI instance that saves the layout,
+# like default button callback, are stored as {"__method__": name}. Offsets
+# are relative to start of data blocks, which are aligned to LAYOUT_ALIGN
+# bytes. For screens that draw in RGB565, RGB images are stored as big-endian
+# RGB565 so that they can be copied into ILI9341 framebuffer without
+# conversion. This is lossy: low 3/2/3 bits of R/G/B channels are dropped.
+# Other screens keep 8-bit images as they are.
+
+LAYOUT_MAGIC = b'EMBCIGUI'
+LAYOUT_VERSION = 1
+LAYOUT_ALIGN = 16
+_layout_header = struct.Struct('<8sHHHI')  # magic, version, w, h, json len
+
+
+def _align(n):
+    return -(-n // LAYOUT_ALIGN) * LAYOUT_ALIGN
+
+
+def dump_layout(fn, widget, width, height, owner=None, rgb565=False):
+    '''
+    Save widget into a binary layout file. Set `rgb565` to pack RGB images
+    into RGB565, which loses precision of colors.
+    '''
+    elements, blocks, size = [], [], 0
+    for name in widget:
+        for e in widget[name]:
+            attrs, arrays, extra = {}, {}, {}
+            for key, value in e.items():
+                if isinstance(value, np.ndarray):
+                    if rgb565 and value.ndim == 3 and value.shape[2] == 3:
+                        value = rgb888to565_array(value.astype(np.uint8))
+                    value = np.ascontiguousarray(value)
+                    arrays[key] = [size, value.shape, value.dtype.str]
+                    blocks.append(value.tobytes())
+                    size += _align(value.nbytes)
+                    continue
+                if owner is not None and getattr(
+                        value, '__self__', None) is owner:
+                    attrs[key] = {'__method__': value.__name__}
+                    continue
+                try:
+                    json.dumps(value)
+                    attrs[key] = value
+                    continue
+                except (TypeError, ValueError):
+                    pass
+                try:
+                    serialize(value, 'dill')
+                    extra[key] = value
+                except Exception:
+                    logger.warning('Skip attribute `{}` of {} {}: {}'.format(
+                        key, name, e.id, traceback.format_exc()))
+            if extra:
+                data = serialize(extra, 'dill')
+                blocks.append(data)
+                extra = [size, len(data)]
+                size += _align(len(data))
+            elements.append([name, attrs, arrays, extra or None])
+    header = json.dumps(elements, separators=(',', ':')).encode('utf8')
+    with open(fn, 'wb') as f:
+        f.write(_layout_header.pack(
+            LAYOUT_MAGIC, LAYOUT_VERSION, width, height, len(header)))
+        f.write(header)
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        for data in blocks:
+            f.write(data)
+            f.write(b'\0' * (_align(len(data)) - len(data)))
+
+
+def load_layout(fn, mmap=True, owner=None):
+    '''
+    Load widget from a binary layout file.
+
+    Parameters
+    ----------
+    fn : str
+        Layout filename.
+    mmap : bool
+        True(default) to map data blocks from file instead of reading them,
+        so that images are only loaded when they are drawn.
+    owner : object, optional
+        Attributes stored as method names are resolved on this object.
+
+    Returns
+    -------
+    widget : AttributeDict
+    resolution : tuple
+        Screen (width, height) that layout file was saved with.
+    '''
+    with open(fn, 'rb') as f:
+        magic, version, width, height, length = _layout_header.unpack(
+            f.read(_layout_header.size))
+        if magic != LAYOUT_MAGIC or version != LAYOUT_VERSION:
+            raise ValueError('invalid layout file `{}`'.format(fn))
+        elements = json.loads(f.read(length).decode('utf8'))
+        start = _align(f.tell())
+        widget = DEFAULT_WIDGET()
+        for name, attrs, arrays, extra in elements:
+            e = AttributeDict()
+            for key, value in attrs.items():
+                if isinstance(value, dict) and '__method__' in value:
+                    if owner is None:
+                        continue
+                    value = getattr(owner, value['__method__'])
+                e[key] = value
+            for key, (offset, shape, dtype) in arrays.items():
+                if mmap:
+                    e[key] = np.memmap(f, dtype, 'r', start + offset, shape)
+                else:
+                    f.seek(start + offset)
+                    e[key] = np.fromfile(
+                        f, dtype, int(np.prod(shape))).reshape(shape)
+            if extra is not None:
+                f.seek(start + extra[0])
+                e.update(deserialize(f.read(extra[1]), 'dill'))
+            widget[name].append(e)
+    return widget, (width, height)
+
+
 # ===============================================================================
 # Mini GUI Framework
 
+
+def _element_state(e):
+    '''Summary of element attributes used to detect modification.'''
+    return tuple(
+        (key, id(value) if isinstance(value, np.ndarray) else repr(value))
+        for key, value in sorted(e.items()) if key != 'dirty')
+
+
+def _element_bbox(e):
+    return (min(e.x1, e.x2), min(e.y1, e.y2),
+            max(e.x1, e.x2), max(e.y1, e.y2))
+
+
+def _overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _contains(a, b):
+    return a[0] <= b[0] and a[1] <= b[1] and b[2] <= a[2] and b[3] <= a[3]
+
+
+def _merge_area(a, b):
+    '''Return union of two areas if it is still a rectangle.'''
+    if (a[1], a[3]) == (b[1], b[3]) and a[0] <= b[2] + 1 and b[0] <= a[2] + 1:
+        return (min(a[0], b[0]), a[1], max(a[2], b[2]), a[3])
+    if (a[0], a[2]) == (b[0], b[2]) and a[1] <= b[3] + 1 and b[1] <= a[3] + 1:
+        return (a[0], min(a[1], b[1]), a[2], max(a[3], b[3]))
+
+
 class Colormap(object):
     '''
     Mapping color (str | int | list | tuple) to specific format that
@@ -185,6 +345,8 @@ class DrawElementMixin(object):
     '''
     encoding = 'utf8'
     width, height = 320, 240
+    # store RGB images of binary layout as RGB565, see `dump_layout`
+    layout_rgb565 = False
 
     def __init__(self):
         '''For testing only. If you subclass this Mixin, call `_init_`.'''
@@ -195,6 +357,22 @@ class DrawElementMixin(object):
         # cannot directly draw on DEFAULT_WIDGET, it's used as a template
         self.widget = DEFAULT_WIDGET()
         self.color = DEFAULT_COLOR()
+        # (element, id) => (state, bbox) of elements on screen
+        self._rendered = None
+        self._rendered_bg = None
+        # element => (AttributeList, length, max id)
+        self._id_index = {}
+
+    def _next_id(self, name):
+        '''Return an unused id of element `name` without scanning widget.'''
+        elements = self.widget[name]
+        index = self._id_index.get(name)
+        if (index is None or index[0] is not elements or
+                index[1] != len(elements)):
+            # widget replaced or modified outside draw_* methods
+            index = (elements, len(elements), max(elements.id or [0]))
+            self._id_index[name] = index
+        return index[2] + 1
 
     def _pre_draw_check(name):
         '''
@@ -215,8 +393,10 @@ class DrawElementMixin(object):
                     a[n] = colormap(a[n])
             # add element into self.widget
             k['element'] = name + ('f' if k.get('fill', False) else '')
-            k['id'] = max(self.widget[k['element']].id or [0]) + 1
+            k['id'] = self._next_id(k['element'])
             func(self, *a, **k)
+            elements = self.widget[k['element']]
+            self._id_index[k['element']] = (elements, len(elements), k['id'])
             if k.pop('render', True):
                 self.render(**k)
         return wrapper
@@ -521,15 +701,17 @@ class DrawElementMixin(object):
         '''Get width and height pixel of string.'''
         return len(s) * 8, 16
 
-    def render(self, element=None, id=None, clear=True, *a, **k):
-        '''Render elements stored in self.widget to screen.'''
-        # render all
+    def render(self, element=None, id=None, clear=True, full=False, *a, **k):
+        '''
+        Render elements stored in self.widget to screen.
+
+        Without `element` and `id`, only elements that are added, removed or
+        modified since last render are cleared and redrawn, together with
+        elements overlapping them. Set `full` to repaint the whole screen.
+        An element can be forced to redraw by setting its `dirty` attribute.
+        '''
         if None in [element, id]:
-            self.clear()  # clear all screen
-            for name in self.widget:
-                for e in self.widget[name]:
-                    self.render(name, e.id, clear=False)
-            return
+            return self._render_changed(full)
         # render one element
         e = self.widget[element, id]
         if e is None:
@@ -540,6 +722,59 @@ class DrawElementMixin(object):
             getattr(self, 'render_%s_hook' % element)(e)
         except (AttributeError, TypeError):
             self.send(element, **e)
+        e.pop('dirty', None)
+        if self._rendered is not None:
+            self._rendered[element, id] = (_element_state(e), _element_bbox(e))
+
+    def _render_changed(self, full=False):
+        elements = [(name, e) for name in self.widget
+                    for e in self.widget[name]]
+        current = {(name, e.id): (_element_state(e), _element_bbox(e))
+                   for name, e in elements}
+        previous = self._rendered
+        if previous is None or self._rendered_bg != self.color['bg']:
+            full = True
+        redraw = set(current)
+        if not full:
+            dirty = [bbox for key, (state, bbox) in previous.items()
+                     if key not in current or current[key][0] != state]
+            dirty.extend(
+                current[name, e.id][1] for name, e in elements
+                if (name, e.id) not in previous or e.get('dirty') or
+                previous[name, e.id][0] != current[name, e.id][0])
+            # elements overlapping dirty areas must be redrawn as a whole,
+            # which in turn dirties their own area
+            redraw = set()
+            grown = True
+            while grown:
+                grown = False
+                for key, (_, bbox) in current.items():
+                    if key in redraw:
+                        continue
+                    if any(_overlap(bbox, area) for area in dirty):
+                        redraw.add(key)
+                        dirty.append(bbox)
+                        grown = True
+            # skip areas covered by others
+            dirty = set(dirty)
+            dirty = [a for a in dirty
+                     if not any(b != a and _contains(b, a) for b in dirty)]
+            area = sum((x2 - x1 + 1) * (y2 - y1 + 1)
+                       for x1, y1, x2, y2 in dirty)
+            if area >= self.width * self.height:
+                full, redraw = True, set(current)
+            else:
+                for x1, y1, x2, y2 in dirty:
+                    self.clear(x1, y1, x2, y2)
+        if full:
+            self.clear()  # clear all screen
+        self._rendered = {}
+        self._rendered_bg = self.color['bg']
+        for name, e in elements:
+            if (name, e.id) in redraw:
+                self.render(name, e.id, clear=False)
+            else:
+                self._rendered[name, e.id] = current[name, e.id]
 
     def render_button_hook(self, e):
         e.c = e.ct
@@ -861,7 +1096,10 @@ class GUIControlMixin(object):
         dir_or_file : str
             Specifiying filename to save or layout file directory.
         format : str
-            Serializition method, choose one from `dill`(default) and `json`
+            Serializition method, choose one from `dill`(default), `json`
+            and `bin`. Binary layout stores images as raw blocks, which are
+            memory-mapped instead of unpickled when loading. Screens with
+            `layout_rgb565` set store RGB images as RGB565, which is lossy.
         overwrite : bool, optional
             True(default) to overwrite layout file if it already exists.
 
@@ -888,14 +1126,19 @@ class GUIControlMixin(object):
             fn += '.{}'.format(method)
 
         try:
-            with open(fn, 'w') as f:
-                f.write(serialize(self.widget, method))
+            if method == 'bin':
+                dump_layout(fn, self.widget, self.width, self.height, self,
+                            self.layout_rgb565)
+            else:
+                with open(fn, 'wb' if method == 'dill' else 'w') as f:
+                    f.write(serialize(self.widget, method))
             logger.info(self.name + 'save layout `{}` success.'.format(fn))
         except Exception:
             logger.info(self.name + 'save layout `{}` failed.'.format(fn))
-            logger.error(traceback.format_ext())
+            logger.error(traceback.format_exc())
 
-    def frame_load(self, dir_or_file, method='dill', extend=False):
+    def frame_load(self, dir_or_file, method='dill', extend=False,
+                   mmap=True, cache=True):
         '''
         Load widgets from specific layout file.
 
@@ -904,10 +1147,18 @@ class GUIControlMixin(object):
         dir_or_file : str
             Layout filename to load or directory under which search for file.
         format : str
-            Deserializition method, choose one from `dill`(default) and `json`
+            Deserializition method, choose one from `dill`(default), `json`
+            and `bin`.
         extend : bool
             True to merge loaded widgets into current frame. False to replace
             current widgets with loaded one. Default False.
+        mmap : bool
+            Map images of binary layout from file. Default True.
+        cache : bool
+            Cache dill/json layout as binary layout of current resolution,
+            named like `layout.pcl.dill.320x240.bin`, and load it next time
+            if it is newer than source layout. Default True. Note that images
+            in cache may be packed as RGB565, see `frame_save`.
         '''
         if not os.path.exists(dir_or_file):
             logger.error(self.name + ' invalid dir or layout file name')
@@ -928,14 +1179,34 @@ class GUIControlMixin(object):
         if ext and method not in ext:
             method = ext[1:]
 
+        cache_fn = '{}.{}x{}.bin'.format(fn, self.width, self.height)
+        if method == 'bin':
+            cache = False
+        elif (cache and os.path.exists(cache_fn) and
+                os.path.getmtime(cache_fn) >= os.path.getmtime(fn)):
+            fn, method, cache = cache_fn, 'bin', False
+
         try:
-            with open(fn) as f:
-                tmp = deserialize(f.read(), method)
+            if method == 'bin':
+                tmp, size = load_layout(fn, mmap, self)
+                if size != (self.width, self.height):
+                    logger.warning('{} layout `{}` is saved for {}x{} screen'
+                                   .format(self.name, fn, *size))
+            else:
+                with open(fn, 'rb' if method == 'dill' else 'r') as f:
+                    tmp = deserialize(f.read(), method)
             logger.info(self.name + 'load layout `{}` success.'.format(fn))
         except Exception:
             logger.info(self.name + 'load layout `{}` failed.'.format(fn))
-            logger.error(traceback.format_ext())
+            logger.error(traceback.format_exc())
             return
+        if cache:
+            try:
+                dump_layout(cache_fn, tmp, self.width, self.height, self,
+                            self.layout_rgb565)
+            except Exception:
+                logger.warning('{} cache layout `{}` failed: {}'.format(
+                    self.name, cache_fn, traceback.format_exc()))
         if extend:
             for element in self.widget:
                 self.widget[element].extend(tmp[element])
@@ -1008,6 +1279,11 @@ class SerialScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin):
     API = functools.partial(
         SerialCommander, command_dict_uart_screen_winbond_v1)
 
+    # Batching configs
+    flush_interval = 0.05
+    batch_bytes = 256
+    cover_area = 64  # min pixels of a fill to drop commands it covers
+
     def __init__(self, API=None, name=None, widget=None, color=None, *a, **k):
         '''
         Constructor for SerialScreenGUI.
@@ -1027,10 +1303,13 @@ class SerialScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin):
             Default GBK
         touch_sense : number
             Touchscreen sensibility.
+        flush_interval : float
+            Max seconds a drawing command waits in batch before it is sent.
+            Set to 0 to send every command immediately.
         '''
         for key in k:
-            if (key in ['height', 'width', 'encoding', 'touch_sense']
-                    and k[key] is not None):
+            if (key in ['height', 'width', 'encoding', 'touch_sense',
+                        'flush_interval'] and k[key] is not None):
                 setattr(self, key, k[key])
         self.name = name or '[Serial Screen GUI Commander {}]'.format(
             SerialCommander.__num__)
@@ -1040,40 +1319,180 @@ class SerialScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin):
         TouchScreenMixin._init_(self)
         GUIControlMixin._init_(self)
 
+        # [key, args, kwargs, area] of commands waiting to be sent
+        self._batch = []
+        self._batch_lock = threading.RLock()
+        self._batch_hold = 0
+        self._flush_timer = None
+
     def start(self, port='/dev/ttyS1', baudrate=115200):
         if self._started:
             return
         self._api.start(port, baudrate)
         self.send('dir', 1)  # set screen vertical
+        self.flush()
         self._started = True
 
     def close(self, *a, **k):
         if not self._started:
             return
         self.send('clear', c='black')
+        self.flush()
         self.touchscreen_close()
         self._api.close(self)
         self._started = False
 
     def send(self, key, *a, **k):
-        ret = self._api.get_command(key)
-        if ret is None:
+        '''
+        Queue a command into current batch. Batched commands are written
+        to serial port by `flush`, which is automatically called after
+        `flush_interval` seconds or at the end of `render`.
+        '''
+        if self._api.get_command(key) is None:
             raise ValueError('element `{}` is not supported'.format(key))
         # Winbond v1 accept 4bits color number
         if 'c' in k:
             k['c'] = self.colormap(k['c'])
-        # UART send bytesarray (Winbond GBK encoding)
-        if 's' in k:
-            k['s'] = k['s'].encode(self.encoding)
+        self._queue(key, a, k)
+        return key
+
+    def _area(self, key, k):
+        '''Bounding box of pixels a command may change, None if unknown.'''
+        if key == 'clear':
+            size = max(self.width, self.height)
+            return (0, 0, size - 1, size - 1)
+        if key == 'point':
+            return (k['x'], k['y'], k['x'], k['y'])
+        if key in ['line', 'rect', 'rectf', 'rrect', 'rrectf']:
+            return (min(k['x1'], k['x2']), min(k['y1'], k['y2']),
+                    max(k['x1'], k['x2']), max(k['y1'], k['y2']))
+        if key in ['circle', 'circlef']:
+            return (k['x'] - k['r'], k['y'] - k['r'],
+                    k['x'] + k['r'], k['y'] + k['r'])
+        if key == 'text':
+            w, h = self.getsize(ensure_unicode(k['s']))
+            return (k['x'], k['y'], k['x'] + w - 1, k['y'] + h - 1)
+
+    def _queue(self, key, a, k):
+        # area of commands with positional arguments is unknown
+        area = None if a else self._area(key, k)
+        with self._batch_lock:
+            batch = self._batch
+            # points, straight lines and filled rectangles are all filled
+            # areas, which can be merged if they have the same color
+            if area is not None and (
+                    key in ['point', 'rectf', 'rrectf'] or key == 'line' and
+                    (area[0] == area[2] or area[1] == area[3])):
+                key, a, k = '_fill', (), {'c': k['c']}
+                last = batch[-1] if batch else None
+                if (last and last[0] == '_fill' and last[2]['c'] == k['c']
+                        and _merge_area(last[3], area)):
+                    area = _merge_area(last[3], area)
+                    batch.pop()
+            batch.append([key, a, k, area])
+            self._schedule()
+
+    def _drop_covered(self, batch):
+        '''
+        Drop commands whose pixels are fully overwritten by later fills.
+        Only fills larger than `cover_area` pixels are checked against, so
+        that a batch of many small fills is filtered in linear time.
+        '''
+        covers, kept = [], []
+        for cmd in reversed(batch):
+            area = cmd[3]
+            if area is None:
+                kept.append(cmd)
+                continue
+            if any(_contains(cover, area) for cover in covers):
+                continue
+            kept.append(cmd)
+            if cmd[0] in ['_fill', 'clear'] and (
+                    (area[2] - area[0] + 1) * (area[3] - area[1] + 1) >=
+                    self.cover_area):
+                covers.append(area)
+        kept.reverse()
+        return kept
+
+    def _schedule(self):
+        if self._batch_hold or not self._batch:
+            return
+        if self.flush_interval <= 0:
+            return self.flush()
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(
+                self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _encode(self, key, a, k, area):
+        '''Yield bytes of a batched command and time to execute it.'''
+        if key == '_fill':
+            x1, y1, x2, y2 = area
+            w, h = x2 - x1 + 1, y2 - y1 + 1
+            cost = {
+                'point': self._api.get_command('point')[1] * w * h,
+                'line': self._api.get_command('line')[1] * min(w, h),
+                'rectf': self._api.get_command('rectf')[1],
+            }
+            key = min(cost, key=cost.get)
+            if key == 'point':
+                points = [{'x': x, 'y': y} for y in range(y1, y2 + 1)
+                          for x in range(x1, x2 + 1)]
+            elif key == 'line' and w >= h:
+                points = [{'x1': x1, 'y1': y, 'x2': x2, 'y2': y}
+                          for y in range(y1, y2 + 1)]
+            elif key == 'line':
+                points = [{'x1': x, 'y1': y1, 'x2': x, 'y2': y2}
+                          for x in range(x1, x2 + 1)]
+            else:
+                points = [{'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}]
+            for p in points:
+                p.update(k)
+                for cmd in self._encode(key, (), p, None):
+                    yield cmd
+            return
+        template, delay = self._api.get_command(key)
         try:
-            ret[0] = ret[0].format(*a, **k)
+            cmd = ensure_unicode(template).format(*a, **k)
         except (IndexError, KeyError):
             logger.error('{} unmatched element {} and param: {}, {}, {}'
-                         .format(self.name, key, ret[0], a, k))
-        with self._api._command_lock:
-            self._api._command_serial.write(ret[0])
-            time.sleep(ret[1])
-        return key
+                         .format(self.name, key, template, a, k))
+            return
+        # UART send bytesarray (Winbond GBK encoding)
+        yield cmd.encode(self.encoding), delay
+
+    def flush(self):
+        '''Write batched commands to screen.'''
+        with self._batch_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            batch, self._batch = self._drop_covered(self._batch), []
+            buf, delay = b'', 0
+            with self._api._command_lock:
+                for cmd in batch:
+                    for data, t in self._encode(*cmd):
+                        if buf and len(buf) + len(data) > self.batch_bytes:
+                            self._api._command_serial.write(buf)
+                            time.sleep(delay)
+                            buf, delay = b'', 0
+                        buf, delay = buf + data, delay + t
+                if buf:
+                    self._api._command_serial.write(buf)
+                    time.sleep(delay)
+
+    def render(self, *a, **k):
+        '''Collect commands of a whole render into one batch.'''
+        with self._batch_lock:
+            self._batch_hold += 1
+        try:
+            super(SerialScreenGUI, self).render(*a, **k)
+        finally:
+            with self._batch_lock:
+                self._batch_hold -= 1
+                if not self._batch_hold:
+                    self.flush()
 
     def getsize(self, s, size=None, font=None):
         '''
@@ -1098,15 +1517,26 @@ class SerialScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin):
         return en_zh.count(False) * 8 + en_zh.count(True) * 16, 16
 
     def render_img_hook(self, e):
-        img = e.img[:, :, 0]
-        x1, y1, x2, y2 = e.x1, e.y1, e.x2, e.y2
-        cmd, delay = self._api._command_dict['point']
-        with self._api._command_lock:
-            for x in range(x2 - x1):
-                for y in range(y2 - y1):
-                    tosend = cmd.format(x=x1 + x, y=y1 + y, c=img[y, x]/16)
-                    self._api._command_serial.write(tosend)
-                    time.sleep(delay)
+        if e.img.ndim == 2:  # RGB565 loaded from binary layout
+            img = e.img >> 8 & 0xF8
+        else:
+            img = e.img[:, :, 0]
+        img = np.asarray(img[:e.y2 - e.y1, :e.x2 - e.x1]) // 16
+        # pixels of same color in a row are merged into one fill, runs are
+        # queued directly because they never overlap each other
+        h, w = img.shape
+        edge = np.ones((h, w + 1), bool)
+        edge[:, 1:w] = img[:, 1:] != img[:, :-1]
+        ys, xs = np.nonzero(edge)
+        run = ys[:-1] == ys[1:]
+        ys, x1s, x2s = ys[:-1][run], xs[:-1][run], xs[1:][run] - 1
+        cs = img[ys, x1s]
+        with self._batch_lock:
+            self._batch.extend(
+                ['_fill', (), {'c': c}, (x1 + e.x1, y, x2 + e.x1, y)]
+                for y, x1, x2, c in zip((ys + e.y1).tolist(), x1s.tolist(),
+                                        x2s.tolist(), cs.tolist()))
+            self._schedule()
 
     def setsize(self, *a, **k):
         '''for compatibility'''
@@ -1143,6 +1573,7 @@ class SPIScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin,
     # Drawing configs
     encoding = 'utf8'
     height, width = 320, 240
+    layout_rgb565 = True
 
     # Touchscreen configs
     _cali_matrix = np.array([[0.1911, -0.1490], [-22.0794, 255.0536]])
@@ -1201,6 +1632,16 @@ class SPIScreenGUI(DrawElementMixin, TouchScreenMixin, GUIControlMixin,
         self.touchscreen_close()
         self._started = False
 
+    def render(self, *a, **k):
+        '''Draw elements on framebuffer and push dirty areas at once.'''
+        batch, self._api.batch = self._api.batch, True
+        try:
+            super(SPIScreenGUI, self).render(*a, **k)
+        finally:
+            self._api.batch = batch
+        if not batch:
+            self._api.commit()
+
     def send(self, name, *a, **k):
         '''Send command `name` to SPI Screen'''
         if 'c' in k:
@@ -11,7 +11,9 @@ from __future__ import division
 from __future__ import print_function
 import time
 
-from embci.drivers.ads1299 import ADS1299_API
+import numpy as np
+
+from embci.drivers.ads1299 import ADS1299_API, decode_int24
 from embci.drivers.esp32 import ESP32_API
 from .. import EmBCITestCase, embeddedonly
 
@@ -63,6 +65,11 @@ class TestADS(EmBCITestCase):
         print(self._api.read())
         self._api.measure_impedance = tmp
 
+    def test_6_read_chunk(self):
+        '''Read several samples at once'''
+        data, ts = self._api.read_chunk(10)
+        self.assertEqual(data.shape, (8, len(ts)))
+
 
 @embeddedonly
 class TestESP(TestADS):
@@ -71,6 +78,12 @@ class TestESP(TestADS):
     FS = 500
 
 
+def test_decode_int24():
+    raw = [0x80, 0x00, 0x00, 0x7f, 0xff, 0xff, 0xff, 0xff, 0xff, 0, 0, 1]
+    assert (decode_int24(raw) == [-2**23, 2**23 - 1, -1, 1]).all()
+    assert decode_int24(np.zeros((5, 24), np.uint8)).shape == (5, 8)
+
+
 if __name__ == '__main__':
     from .. import test_with_unittest
     test_with_unittest(TestADS, TestESP)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# coding=utf-8
+#
+# File: EmBCI/tests/drivers/test_emulator.py
+
+# built-in
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import time
+
+import numpy as np
+
+from embci.drivers.emulator import (
+    DRDYEmulator, EmulatedADS1299_API, EmulatedESP32_API)
+from embci.io import ESP32SPIReader
+
+
+def test_drdy_emulator():
+    drdy = DRDYEmulator(rate=200)
+    drdy.export = True
+    assert drdy.poll(1)
+    edges = drdy.edges
+    time.sleep(0.1)
+    assert 15 <= drdy.edges - edges <= 25
+    drdy.export = False
+    assert drdy.poll(0) and not drdy.poll(0)
+    drdy.close()
+
+
+def test_emulated_ads1299():
+    api = EmulatedADS1299_API()
+    api.open((0, 0))
+    api.start(1000)
+    assert api.read_register(0x00) == 0x3E
+    data, ts = api.read_chunk(10)
+    assert data.shape == (8, 10)
+    assert (np.diff(ts) > 0).all()
+    api.write([0x11, 0x45, 0x00, 0x81, 0x10])  # power down channel 1
+    assert not api.read_chunk(1)[0][0].any()
+    assert api._chip.commands_ignored == 0
+    api.close()
+    api._DRDY.close()
+
+
+def test_register_shadow():
+    api = EmulatedADS1299_API()
+    api.set_input_source('test')  # applied in start
+    api.open((0, 0))
+    api.start(500)
+    assert api._chip.regs[5] & 0b111 == 0b101
+    api.enable_bias = True
+    api.measure_impedance = True
+    api.set_sample_rate(1000)
+    assert api._chip.regs == api._regs
+    assert api._chip.commands_ignored == 0
+    assert api._chip.rdatac
+    api.close()
+    api._DRDY.close()
+
+
+def test_register_default_kept():
+    api = EmulatedADS1299_API()
+    api.set_input_source('shorted')  # same as power-on default 0x61
+    api.open((0, 0))
+    api.start(500)
+    assert api._chip.regs[5:13] == [0x61] * 8
+    assert api._chip.regs[6] == api._regs[6]
+    api.close()
+    api._DRDY.close()
+
+
+def test_channel_mask():
+    api = EmulatedADS1299_API()
+    api.set_channel(2, False)
+    api.open((0, 0))
+    api.start(500)
+    assert api._chip.regs[7] >> 7
+    assert api.read()[0].shape == (7, )
+    api.set_channel(2, True)
+    assert api.channel_mask == [True] * 8
+    assert api.read_chunk(4)[0].shape == (8, 4)
+    api.close()
+    api._DRDY.close()
+
+
+def test_emulated_esp32_reader():
+    reader = ESP32SPIReader(500, 2, 8, API=EmulatedESP32_API)
+    reader.set_channel(0, False)
+    reader.start((0, 0), method='thread')
+    reader.wait_for_samples(64, timeout=2, cursor=0)
+    assert reader.channels[:2] == ['ch2', 'ch3']
+    assert reader.data_last(64).shape == (8, 64)
+    assert np.abs(reader.data_last(64)[:7]).max() > 0
+    reader.close()
+    ESP32SPIReader.remove(ESP32SPIReader)
+    reader._api._DRDY.close()
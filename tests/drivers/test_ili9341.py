@@ -5,7 +5,10 @@
 # Authors: Hank <hankso1106@gmail.com>
 # Create: 2019-02-23 13:47:11
 
-'''Testing GUI on screen devices is not a good idea.'''
+'''
+Testing GUI on screen devices is not a good idea. Drawing tests that only
+touch the framebuffer run on a fake API without SPI and GPIO.
+'''
 
 # built-in
 from __future__ import absolute_import
@@ -18,15 +21,195 @@ import os
 import pytest
 import numpy as np
 
-pytest.skip('skip embedded device only tests', allow_module_level=True)
-
 from embci.configs import DIR_SRC
 from embci.utils import get_config
-from embci.drives.ili9341 import (
-    ILI9341_API, rgb888to565, rgb24to565,
+from embci.drivers import ili9341
+from embci.drivers.ili9341 import (
+    ILI9341_API, rgb888to565, rgb888to565_pro, rgb24to565, rgb888to565_array,
+    rasterize_segments,
     ILI9341_WHITE, ILI9341_GREEN, ILI9341_BLUE, ILI9341_CYAN,
     ILI9341_YELLOW, ILI9341_RED, ILI9341_MAGENTA
 )
+from .. import embeddedonly
+
+
+class FakePin(object):
+    def __init__(self, pin):
+        self.value = 0
+
+
+class FakeILI9341(ILI9341_API):
+    '''Record SPI transfers instead of writing to device.'''
+    GPIO = FakePin
+
+    def __init__(self, *a, **k):
+        super(FakeILI9341, self).__init__(*a, **k)
+        self.log = []
+
+    def writebytes(self, data):
+        self.log.append(('cmd', data[0]))
+
+    def xfer2(self, data):
+        self.log.append(('data', bytes(bytearray(data))))
+
+    def writebytes2(self, data):
+        self.log.append(('data', bytes(data)))
+
+    def windows(self):
+        '''Return list of (x1, y1, x2, y2, pixels) pushed to screen.'''
+        pushed, window = [], [0] * 4
+        for kind, value in self.log:
+            if kind == 'cmd':
+                cmd = value
+            elif cmd in (0x2A, 0x2B):
+                b = bytearray(value)
+                i = 0 if cmd == 0x2A else 1
+                window[i], window[i + 2] = b[0] << 8 | b[1], b[2] << 8 | b[3]
+            elif cmd == 0x2C:
+                x1, y1, x2, y2 = window
+                pushed.append((x1, y1, x2, y2, np.frombuffer(
+                    value, np.uint8).reshape(y2 - y1 + 1, x2 - x1 + 1, 2)))
+        self.log = []
+        return pushed
+
+
+@pytest.fixture
+def fake():
+    return FakeILI9341(dc=None)
+
+
+def test_rasterize_segments():
+    x1, y1 = [0, 0, 5, 3, 10], [0, 0, 9, 3, 0]
+    x2, y2 = [7, 3, 0, 3, 0], [2, 9, 0, 3, 0]
+    x, y, index = rasterize_segments(x1, y1, x2, y2)
+    assert np.bincount(index).tolist() == [8, 10, 10, 1, 11]
+    for i in range(5):
+        xs, ys = x[index == i], y[index == i]
+        assert (xs[0], ys[0], xs[-1], ys[-1]) == (x1[i], y1[i], x2[i], y2[i])
+        # connected: one step on the major axis per pixel, at most one on
+        # the minor axis
+        step = np.abs(np.diff(xs)) + np.abs(np.diff(ys))
+        assert ((step >= 1) & (step <= 2)).all()
+        assert (np.abs(np.diff(xs)) <= 1).all()
+        assert (np.abs(np.diff(ys)) <= 1).all()
+        # pixels are nearest to the ideal line
+        n = max(abs(x2[i] - x1[i]), abs(y2[i] - y1[i]), 1)
+        t = np.arange(len(xs)) / float(n)
+        assert (np.abs(xs - (x1[i] + (x2[i] - x1[i]) * t)) <= 0.5).all()
+        assert (np.abs(ys - (y1[i] + (y2[i] - y1[i]) * t)) <= 0.5).all()
+
+
+def test_draw_polyline_batch(fake):
+    fake.batch = True
+    fake.draw_polyline([0, 50, 100], [0, 40, 0], ILI9341_GREEN)
+    fake.draw_line(200, 200, 210, 230, ILI9341_RED)
+    assert fake.fb[40, 50].tolist() == ILI9341_GREEN
+    assert fake.fb[230, 210].tolist() == ILI9341_RED
+    assert not fake.log
+    assert fake.commit() == 2
+    pushed = fake.windows()
+    assert [w[:4] for w in pushed] == [(0, 0, 100, 40), (200, 200, 210, 230)]
+    for x1, y1, x2, y2, pixels in pushed:
+        assert (pixels == fake.fb[y1:y2 + 1, x1:x2 + 1]).all()
+
+
+def test_draw_img_opaque(fake):
+    img = np.random.randint(0, 256, (20, 30, 3)).astype(np.uint8)
+    fake.draw_img(-5, 230, img)  # clipped by screen edges
+    expect = [
+        rgb888to565_pro(*px) for px in img[:10, 5:].reshape(-1, 3).tolist()]
+    assert fake.fb[230:, :25].reshape(-1, 2).tolist() == expect
+    x1, y1, x2, y2, pixels = fake.windows()[0]
+    assert (x1, y1, x2, y2) == (0, 230, 24, 239)
+    assert (pixels == fake.fb[230:, :25]).all()
+
+
+def test_blend565(fake):
+    dst = np.random.randint(0, 0x10000, (8, 16))
+    src = np.random.randint(0, 0x10000, (8, 16))
+    alpha = np.random.randint(0, 257, (8, 16))
+    alpha[0], alpha[1] = 0, 256
+    fake.fb[:8, :16, 0], fake.fb[:8, :16, 1] = dst >> 8, dst & 0xFF
+    fake._blend565(0, 0, 16, 8, src, alpha)
+    out = fake.fb[:8, :16, 0].astype(int) << 8 | fake.fb[:8, :16, 1]
+    assert (out[0] == dst[0]).all() and (out[1] == src[1]).all()
+    for shift, mask in ((11, 0x1F), (5, 0x3F), (0, 0x1F)):
+        d, s, o = [v >> shift & mask for v in (dst, src, out)]
+        assert (np.abs(d + (s - d) * alpha / 256.0 - o) <= 0.5).all()
+    # single color
+    fake._blend565(0, 0, 16, 8, 0xFFFF, np.full((8, 16), 256))
+    assert (fake.fb[:8, :16] == 0xFF).all()
+
+
+def test_draw_img_alpha(fake):
+    fake.draw_rectf(0, 0, 9, 9, ILI9341_RED)
+    img = np.zeros((10, 10, 4), np.uint8)
+    img[..., 1] = 255  # green
+    img[:, :5, 3] = 255
+    img[:, 5:, 3] = 0
+    fake.draw_img(0, 0, img)
+    assert (fake.fb[:10, :5] == rgb888to565(0, 255, 0)).all()
+    assert (fake.fb[:10, 5:10] == ILI9341_RED).all()
+
+
+def test_draw_img_rgb565(fake):
+    img = np.random.randint(0, 256, (60, 80, 3)).astype(np.uint8)
+    fake.draw_img(10, 10, img)
+    fb = fake.fb[10:70, 10:90].copy()
+    fake.fb[:] = 0
+    packed = rgb888to565_array(img)
+    fake.draw_img(10, 10, packed)  # big-endian, same layout as framebuffer
+    assert (fake.fb[10:70, 10:90] == fb).all()
+    fake.fb[:] = 0
+    fake.draw_img(-10, 200, packed.astype(np.uint16))  # native, clipped
+    assert (fake.fb[200:, :70] == fb[:40, 10:]).all()
+
+
+@pytest.fixture
+def font():
+    # YaHeiMono is not distributed with source code, fall back to icons
+    fn = os.path.join(DIR_SRC, 'webui', 'fonts', 'YaHeiMono.ttf')
+    if os.path.exists(fn):
+        return fn, u'EmBCI'
+    fn = os.path.join(DIR_SRC, 'webui', 'fonts', 'fa-solid-900.ttf')
+    return fn, u'\uf015\uf007\uf1e6\uf015'
+
+
+def test_draw_text_glyph_cache(fake, font, monkeypatch):
+    fn, s = font
+    fake.setfont(fn, 16)
+    fake.draw_text(10, 10, s, ILI9341_RED)
+    assert len(fake._glyphs) == len(set(s))
+    assert fake.fb.any()
+    glyphs = dict(fake._glyphs)
+    # glyphs are shared by all colors, nothing is rendered again
+    renders = []
+    monkeypatch.setattr(ili9341.ImageDraw, 'Draw', renders.append)
+    fake.draw_text(10, 100, s, ILI9341_GREEN)
+    assert not renders
+    assert all(fake._glyphs[key] is glyphs[key] for key in glyphs)
+    monkeypatch.undo()
+
+    # blended pixels are the same as rendering without cache
+    uncached = FakeILI9341(dc=None)
+    uncached.glyph_cache_size = 0
+    uncached.setfont(fn, 16)
+    uncached.draw_text(10, 10, s, ILI9341_RED)
+    uncached.draw_text(10, 100, s, ILI9341_GREEN)
+    assert not uncached._glyphs
+    assert (uncached.fb == fake.fb).all()
+
+    # least recently used glyph is evicted
+    fake.glyph_cache_size = 2
+    keys = [(fn, 16, char) for char in s]
+    fake.draw_text(0, 200, s[:3], ILI9341_WHITE)
+    assert list(fake._glyphs) == keys[1:3]
+    fake.draw_text(0, 200, s[1], ILI9341_WHITE)
+    fake.draw_text(0, 200, s[0], ILI9341_WHITE)
+    assert list(fake._glyphs) == [keys[1], keys[0]]
+    fake.setsize(20)
+    fake.draw_text(0, 200, s[0], ILI9341_WHITE)
+    assert list(fake._glyphs) == [keys[0], (fn, 20, s[0])]
 
 
 @pytest.fixture(scope='module')
@@ -42,10 +225,12 @@ def obj():
     ili.close()
 
 
+@embeddedonly
 def test_setfont(obj):
     obj.setfont(os.path.join(DIR_SRC, 'webui', 'fonts', 'YaHeiMono.ttf'))
 
 
+@embeddedonly
 def test_draw_basic(obj):
     for i in range(240):
         obj.draw_point(i, i, [int(i / 240.0 * 0xff)] * 2)
@@ -60,13 +245,24 @@ def test_draw_basic(obj):
     obj.draw_round(100, 100, 15, ILI9341_WHITE, 3)
 
 
+@embeddedonly
 def test_draw_round_rectf(obj):
     tiffany_blue = rgb888to565(0x0A, 0xBA, 0xB5)
     obj.draw_round_rectf(150, 120, 300, 220, 7, tiffany_blue)
 
 
+@embeddedonly
 def test_draw_text(obj):
     for i in range(5):
         x, y = np.random.randint(0, 200, 2)
         c = np.random.randint(0xffffff)
         obj.draw_text(x, y, 'EmBCI', rgb24to565(c))
+
+
+@embeddedonly
+def test_draw_waveform(obj):
+    obj.draw_polyline([0, 80, 160, 240, 319], [120, 20, 220, 20, 120],
+                      ILI9341_GREEN)
+    data = np.sin(np.linspace(0, 20, 500) + np.arange(8)[:, None])
+    obj.draw_waveform(data, (0, 0, 319, 239), bg=[0x00, 0x00],
+                      c=[ILI9341_RED, ILI9341_CYAN])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# coding=utf-8
+#
+# File: EmBCI/tests/processing/test_preprocessing.py
+
+# built-in
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# requirements.txt: testing: pytest
+# requirements.txt: data: numpy
+import pytest
+import numpy as np
+
+from embci.processing import StreamingFilter
+
+
+@pytest.fixture
+def data():
+    np.random.seed(0)
+    return np.random.randn(4, 1000) + np.arange(4)[:, None] * 10
+
+
+def test_streaming_filter(data):
+    sf = StreamingFilter(500, notch=50, bandpass=(4, 40))
+    full = StreamingFilter(500, notch=50, bandpass=(4, 40)).process(data)
+    blocks = [sf.process(data[:, :1]), sf.process(data[:, 1:100]),
+              sf.process(data[:, 100])[:, np.newaxis],
+              sf.process(data[:, 101:])]
+    assert np.allclose(np.hstack(blocks), full)
+
+
+def test_single_sample(data):
+    sf = StreamingFilter(500, notch=50)
+    full = StreamingFilter(500, notch=50).process(data[:, :20])
+    samples = [sf.process(data[:, i]) for i in range(20)]
+    assert samples[0].shape == (4, )
+    assert np.allclose(np.column_stack(samples), full)
+
+
+def test_design_keeps_state(data):
+    sf = StreamingFilter(500, notch=50, bandpass=(4, 40))
+    full = StreamingFilter(500, notch=50, bandpass=(4, 40)).process(data)
+    head = sf.process(data[:, :500])
+    zi = sf.zi
+    sf.design(500, notch=50, bandpass=[4, 40])  # same parameters
+    assert sf.zi is zi
+    assert np.allclose(np.hstack([head, sf.process(data[:, 500:])]), full)
+    sf.design(500, notch=50, bandpass=(8, 30))
+    assert sf.zi is None and sf.bandpass == (8, 30)
+    sf.design(250)
+    assert sf.sos is None
+    assert sf.process(data) is data
+
+
+def test_reset_channel(data):
+    sf = StreamingFilter(500, bandpass=(4, 40))
+    sf.process(data[:, :500])
+    zi = sf.zi.copy()
+    # channels are initialized by first sample of next block
+    sf.reset(channel=[1, 2])
+    assert np.allclose(sf.zi, zi)
+    out = sf.process(data[:, 500:])
+    fresh = StreamingFilter(500, bandpass=(4, 40)).process(data[1:3, 500:])
+    assert np.allclose(out[1:3], fresh)
+    assert not np.allclose(out[0], StreamingFilter(
+        500, bandpass=(4, 40)).process(data[0, 500:][None])[0])
+    # steady state of given samples, of all or only selected channels
+    zi = sf.zi.copy()
+    sf.reset(data[:, 0], channel=0)
+    sf.reset([data[3, 0]], channel=np.arange(4) == 3)
+    steady = StreamingFilter(500, bandpass=(4, 40))
+    steady.reset(data[:, 0])
+    assert np.allclose(sf.zi[:, [0, 3]], steady.zi[:, [0, 3]])
+    assert np.allclose(sf.zi[:, 1:3], zi[:, 1:3])
+    sf.reset()
+    assert sf.zi is None
@@ -14,6 +14,7 @@ from __future__ import division
 from __future__ import print_function
 import os
 import time
+import socket
 import warnings
 import threading
 
@@ -23,6 +24,14 @@ import threading
 import pytest
 import serial
 import pylsl
+import numpy as np
+import scipy.signal
+
+from embci.io import (
+    MergedReader, FilesReader, SerialReader,
+    SocketTCPReader, SocketUDPReader, SocketTCPServer, pack_frame
+)
+from embci.utils import virtual_serial
 
 
 # =============================================================================
@@ -92,6 +101,42 @@ def test_reader_data(reader):
     assert reader.data_frame.shape == (8, 1000)
 
 
+def test_reader_ring(reader):
+    cursor = reader.ring_seq
+    time.sleep(0.1)
+    data, new = reader.data_since(cursor)
+    assert new > cursor
+    assert data.shape == (9, new - cursor)
+    assert (np.diff(data[-1]) > 0).all()  # timestamps are in order
+
+
+def test_reader_snapshot(reader):
+    out = np.zeros((9, 1000), np.float32)
+    assert reader.snapshot(out) is out
+    segments = reader.data_frame_view
+    assert sum(seg.shape[1] for seg in segments) == 1000
+
+
+def test_reader_history(reader):
+    assert reader.data_last(100).shape == (9, 100)
+    t = reader.data_channel_t[-1]
+    data = reader.data_range(t - 0.5, t)
+    assert np.all(data[-1] >= t - 0.5) and np.all(data[-1] < t)
+
+
+def test_merged_reader(reader):
+    other = Reader(sample_rate=200, sample_time=2, num_channel=2)
+    merged = MergedReader([reader, other], sample_rate=250)
+    assert merged.num_channel == 10
+    merged.start()
+    time.sleep(1)
+    data = merged.data_all
+    assert data.shape[0] == 11
+    assert np.allclose(np.diff(data[-1]), 1.0 / 250, atol=1e-4)
+    merged.close()
+    other.close()
+
+
 def test_reader_pylsl(reader):
     info = find_pylsl_outlets(source_id=reader.name)
     assert isinstance(info, pylsl.StreamInfo)
@@ -105,11 +150,152 @@ def test_set_sample_rate(reader):
     assert abs(reader.realtime_samplerate - 250) < 100
 
 
+def test_files_reader(tmpdir):
+    src = np.random.rand(2, 1000).astype(np.float32)
+    fn = str(tmpdir.join('replay.npy'))
+    np.save(fn, src)
+    reader = FilesReader(fn, sample_rate=250, num_channel=2,
+                         speed=0, source_rate=500, history_seconds=4)
+    reader.start()
+    reader.wait_for_samples(500, timeout=5, cursor=0)
+    data = reader.data_last(500)
+    assert np.allclose(
+        data[:2], scipy.signal.resample_poly(src, 1, 2, axis=-1), atol=1e-5)
+    assert np.allclose(np.diff(data[-1]), 1.0 / 250, atol=1e-6)  # float32
+    reader.close()
+
+
+def test_files_reader_num_channel(tmpdir):
+    fn = str(tmpdir.join('replay.npy'))
+    np.save(fn, np.random.rand(3, 200).astype(np.float32))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        reader = FilesReader(fn, sample_rate=250, num_channel=5, speed=0)
+        reader.start()
+    assert reader.num_channel == 3
+    assert reader.channels == ['ch1', 'ch2', 'ch3', 'time']
+    reader.wait_for_samples(200, timeout=5, cursor=0)
+    assert reader.data_frame_t.shape[0] == len(reader.channels)
+    reader.close()
+
+
+def test_serial_reader_binary():
+    flag_stop, port1, port2 = virtual_serial(verbose=False)
+    reader = SerialReader(250, 2, 2, protocol='binary')
+    reader.start(port1)
+    slave = serial.Serial(port2, 115200)
+    data = np.arange(20, dtype='<f4').reshape(10, 2)
+    stream = b'junk'
+    for row in data:
+        payload = row.tobytes()
+        checksum = sum(bytearray(payload)) & 0xFF
+        stream += b'\xa5\x5a' + bytes(bytearray([len(payload)]))
+        stream += payload + bytes(bytearray([checksum]))
+    slave.write(stream)
+    reader.wait_for_samples(10, timeout=2, cursor=0)
+    assert reader.frames_recv == 10
+    assert (reader.data_last(10)[:2] == data.T).all()
+    reader.close()
+    slave.close()
+    flag_stop.set()
+
+
+def test_serial_reader_text_silent_start():
+    flag_stop, port1, port2 = virtual_serial(verbose=False)
+    slave = serial.Serial(port2, 115200)
+    lines = b''.join(b'%d,%d,%d\n' % (i, i + 1, i + 2) for i in range(50))
+
+    def send_later():
+        time.sleep(1.2)  # device is silent for a while
+        slave.write(b'1,2\n' + lines)  # first line may be incomplete
+    thread = threading.Thread(target=send_later)
+    thread.start()
+    reader = SerialReader(250, 2, 4, protocol='text')
+    reader.start(port1)
+    thread.join()
+    assert reader.num_channel == 3
+    reader.wait_for_samples(40, timeout=2, cursor=0)
+    assert (reader.data_last(1)[:3, 0] == [49, 50, 51]).all()
+    reader.close()
+
+    # device keeps silent, configured number of channels is kept
+    reader = SerialReader(250, 2, 4, protocol='text')
+    reader.probe_timeout = 0.5
+    reader.start(port1)
+    assert reader.num_channel == 4
+    slave.write(lines.replace(b'\n', b',0\n'))
+    reader.wait_for_samples(40, timeout=2, cursor=0)
+    assert (reader.data_last(1)[:4, 0] == [49, 50, 51, 0]).all()
+    reader.close()
+    slave.close()
+    flag_stop.set()
+
+
+def test_socket_udp_reader():
+    reader = SocketUDPReader(100, 2, 3, address='127.0.0.1:0')
+    reader.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for seq in (0, 1, 3):  # frame 2 is lost
+        data = np.full((3, 10), seq, np.float32)
+        sock.sendto(pack_frame(seq, data, seq * 0.1), reader.address)
+    sock.sendto(b'invalid frame', reader.address)
+    reader.wait_for_samples(30, timeout=2, cursor=0)
+    assert reader.frames_recv == 3
+    assert reader.frames_lost == 1
+    assert reader.frames_bad == 1
+    assert (reader.data_last(30)[0] == np.repeat([0, 1, 3], 10)).all()
+    sock.close()
+    reader.close()
+
+
+def test_socket_tcp_reader():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    reader = SocketTCPReader(100, 2, 3)
+    reader.start(server.getsockname())
+    conn, _ = server.accept()
+    stream = b''.join([
+        pack_frame(seq, np.full((3, 10), seq), seq * 0.1, prefix=True)
+        for seq in range(3)])
+    conn.sendall(stream[:50])  # frames may be split by TCP
+    time.sleep(0.1)
+    conn.sendall(stream[50:])
+    reader.wait_for_samples(30, timeout=2, cursor=0)
+    assert reader.frames_recv == 3 and reader.frames_lost == 0
+    assert (reader.data_last(30)[0] == np.repeat([0, 1, 2], 10)).all()
+    reader.close()
+    conn.close()
+    server.close()
+
+
+def test_socket_tcp_server_reader():
+    server = SocketTCPServer('127.0.0.1', 0)
+    server.start()
+    reader = SocketTCPReader(100, 2, 3)
+    reader.start((server.host, server.port))
+    for i in range(50):
+        if server.has_listeners():
+            break
+        time.sleep(0.05)
+    server.multicast_frame(np.full((3, 10), 7))
+    for i in range(5):  # one sample per frame, like DisplayWeb does
+        server.multicast_frame(np.arange(3) + i)
+    reader.wait_for_samples(15, timeout=2, cursor=0)
+    assert reader.frames_recv == 6
+    assert reader.frames_lost == reader.frames_bad == 0
+    data = reader.data_last(15)
+    assert (data[:3, :10] == 7).all()
+    assert (data[0, 10:] == np.arange(5)).all()
+    assert (data[2, 10:] == np.arange(5) + 2).all()
+    reader.close()
+    server.close()
+
+
 # =============================================================================
 # Commanders
 #
 from embci.io import SerialCommander
-from embci.utils import virtual_serial
 
 
 @pytest.fixture(scope='module')
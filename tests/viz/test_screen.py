@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# coding=utf-8
+#
+# File: EmBCI/tests/viz/test_screen.py
+
+# built-in
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+import numpy as np
+
+from embci.utils import AttributeDict
+from embci.viz import screen
+from embci.viz.screen import (
+    DrawElementMixin, SerialScreenGUI, dump_layout, load_layout)
+from embci.drivers.ili9341 import rgb888to565_array
+
+
+class RecordGUI(DrawElementMixin):
+    '''Record elements sent to screen instead of drawing them.'''
+    def __init__(self):
+        self._init_()
+        self.sent = []
+
+    def send(self, key, **k):
+        # area cleared by `clear` is sent as a `rectf` without id
+        self.sent.append((key, k.get('id')))
+
+    def add(self, name, x1, y1, x2, y2):
+        e = AttributeDict(id=self._next_id(name), x1=x1, y1=y1, x2=x2, y2=y2)
+        self.widget[name].append(e)
+        return e
+
+    def pop_sent(self):
+        sent, self.sent = self.sent, []
+        return sent
+
+
+@pytest.fixture
+def gui():
+    gui = RecordGUI()
+    gui.add('rect', 0, 0, 10, 10)
+    gui.add('rect', 5, 5, 20, 20)    # overlaps rect 1
+    gui.add('rectf', 18, 18, 30, 30)  # overlaps rect 2 only
+    gui.add('line', 100, 100, 150, 150)
+    gui.render()
+    return gui
+
+
+def test_render_full(gui):
+    assert gui.pop_sent() == [
+        ('clear', None), ('line', 1), ('rect', 1), ('rect', 2), ('rectf', 1)]
+    gui.render()
+    assert gui.pop_sent() == []
+    gui.render(full=True)
+    assert len(gui.pop_sent()) == 5
+
+
+def test_render_changed(gui):
+    gui.pop_sent()
+    gui.widget.line[0].x2 = 160
+    gui.render()
+    assert gui.pop_sent() == [('rectf', None), ('line', 1)]
+    # rect 1 overlaps rect 2, which in turn overlaps rectf 1
+    gui.widget.rect[0].x2 = 12
+    gui.render()
+    sent = gui.pop_sent()
+    assert sorted(k for k in sent if k[1] is not None) == [
+        ('rect', 1), ('rect', 2), ('rectf', 1)]
+    assert ('line', 1) not in sent and ('clear', None) not in sent
+
+
+def test_render_removed_and_dirty(gui):
+    gui.pop_sent()
+    del gui.widget.rectf[0]
+    gui.render()
+    sent = gui.pop_sent()
+    assert sorted(k for k in sent if k[1] is not None) == [
+        ('rect', 1), ('rect', 2)]
+    assert ('line', 1) not in sent
+    gui.widget.line[0].dirty = True
+    gui.render()
+    assert gui.pop_sent() == [('rectf', None), ('line', 1)]
+    assert 'dirty' not in gui.widget.line[0]
+    gui.add('rect', 200, 200, 210, 210)
+    gui.render()
+    assert gui.pop_sent() == [('rectf', None), ('rect', 3)]
+
+
+def callback(*a, **k):
+    return 'clicked'
+
+
+@pytest.mark.parametrize('rgb565', [False, True])
+@pytest.mark.parametrize('mmap', [False, True])
+def test_layout_roundtrip(tmpdir, rgb565, mmap):
+    owner = RecordGUI()
+    img = np.random.randint(0, 256, (12, 16, 3)).astype(np.uint8)
+    owner.widget.img.append(AttributeDict(
+        id=1, x1=0, y1=0, x2=16, y2=12, img=img))
+    owner.widget.button.append(AttributeDict(
+        id=1, x1=0, y1=20, x2=40, y2=40, s='OK', callback=callback,
+        render=owner.render))
+    fn = str(tmpdir.join('layout.bin'))
+    dump_layout(fn, owner.widget, 320, 240, owner, rgb565)
+    widget, size = load_layout(fn, mmap, owner)
+    assert size == (320, 240)
+    e = widget.img[0]
+    assert (e.x1, e.y1, e.x2, e.y2) == (0, 0, 16, 12)
+    if rgb565:  # packed for ILI9341 framebuffer
+        assert e.img.dtype.str == '>u2'
+        assert (e.img == rgb888to565_array(img)).all()
+    else:
+        assert (e.img == img).all() and e.img.dtype == np.uint8
+    b = widget.button[0]
+    assert b.s == 'OK' and b.callback() == 'clicked'
+    assert b.render == owner.render
+
+
+RED, BLUE = (255, 0, 0), (0, 0, 255)
+
+
+class FakeSerial(object):
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+@pytest.fixture
+def serial_gui(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(screen.time, 'sleep', sleeps.append)
+    gui = SerialScreenGUI(name='test', flush_interval=10)
+    gui._api._command_serial = FakeSerial()
+    gui.sleeps = sleeps
+    yield gui
+    gui.flush()
+
+
+def sent_commands(gui):
+    gui.flush()
+    data = b''.join(gui._api._command_serial.written)
+    gui._api._command_serial.written = []
+    return data.decode(gui.encoding).split('\r\n')[:-1]
+
+
+def test_serial_merge_fills(serial_gui):
+    c = serial_gui.colormap(RED)
+    for x in range(20):
+        serial_gui.send('point', x=x, y=5, c=RED)
+    serial_gui.send('line', x1=20, y1=5, x2=30, y2=5, c=RED)
+    assert len(serial_gui._batch) == 1
+    assert sent_commands(serial_gui) == ['PL(0,5,30,5,{});'.format(c)]
+    # rows of same color are merged into a filled rectangle
+    for y in range(10):
+        serial_gui.send('line', x1=0, y1=y, x2=9, y2=y, c=RED)
+    assert sent_commands(serial_gui) == ['BOXF(0,0,9,9,{});'.format(c)]
+    # different colors are not merged, and a short fill is sent as points
+    serial_gui.send('point', x=0, y=0, c=RED)
+    serial_gui.send('point', x=1, y=0, c=BLUE)
+    assert [cmd[:2] for cmd in sent_commands(serial_gui)] == ['PS', 'PS']
+
+
+def test_serial_encoding_choice(serial_gui):
+    c = serial_gui.colormap(RED)
+    serial_gui.send('rectf', x1=0, y1=0, x2=1, y2=9, c=RED)
+    assert sent_commands(serial_gui) == [
+        'PL(0,0,0,9,{});'.format(c), 'PL(1,0,1,9,{});'.format(c)]
+    serial_gui.send('rectf', x1=0, y1=0, x2=1, y2=0, c=RED)
+    assert sent_commands(serial_gui) == [
+        'PS(0,0,{});'.format(c), 'PS(1,0,{});'.format(c)]
+    serial_gui.send('rectf', x1=0, y1=0, x2=20, y2=20, c=RED)
+    assert sent_commands(serial_gui) == ['BOXF(0,0,20,20,{});'.format(c)]
+
+
+def test_serial_drop_covered(serial_gui):
+    serial_gui.send('dir', 1)  # unknown area, always kept
+    serial_gui.send('text', x=10, y=10, s='EmBCI', c=RED)
+    serial_gui.send('point', 1, 2)  # positional args, area is unknown
+    assert serial_gui._batch[-1][:2] == ['point', (1, 2)]
+    serial_gui._batch.pop()
+    serial_gui.send('circle', x=30, y=30, r=5, c=RED)
+    serial_gui.send('rectf', x1=0, y1=0, x2=49, y2=29, c=BLUE)
+    cmds = sent_commands(serial_gui)
+    assert cmds == ['DIR(1);', 'CIR(30,30,5,9);', 'BOXF(0,0,49,29,12);']
+    serial_gui.send('text', x=10, y=10, s='EmBCI', c=RED)
+    serial_gui.send('clear')
+    assert sent_commands(serial_gui) == ['CLR(0);']
+
+
+def test_serial_batch_bytes(serial_gui):
+    serial_gui.batch_bytes = 40
+    for i in range(10):
+        serial_gui.send('text', x=0, y=i * 16, s='line %d' % i, c=RED)
+    serial_gui.flush()
+    written = serial_gui._api._command_serial.written
+    assert len(written) > 1
+    assert all(len(data) <= 40 for data in written)
+    cmds = b''.join(written).decode('gbk').split('\r\n')[:-1]
+    assert [cmd.split(',')[2] for cmd in cmds] == [
+        'line %d' % i for i in range(10)]
+    delay = serial_gui._api.get_command('text')[1]
+    assert len(serial_gui.sleeps) == len(written)
+    assert np.isclose(sum(serial_gui.sleeps), delay * 10)
+
+
+def test_serial_render(serial_gui):
+    serial_gui.widget.rectf.append(AttributeDict(
+        id=1, x1=0, y1=0, x2=30, y2=30, c=RED))
+    img = np.zeros((2, 24, 3), np.uint8)
+    img[0, 12:] = 255
+    img[1] = 128
+    serial_gui.widget.img.append(AttributeDict(
+        id=1, x1=100, y1=50, x2=124, y2=52, img=img))
+    serial_gui.render()
+    # batch is written at the end of render without waiting for timer
+    assert serial_gui._flush_timer is None
+    assert serial_gui._api._command_serial.written
+    cmds = sent_commands(serial_gui)
+    assert cmds[0] == 'CLR(0);'
+    assert sorted(cmds[1:]) == [
+        'BOXF(0,0,30,30,9);', 'PL(100,50,111,50,0);',
+        'PL(100,51,123,51,8);', 'PL(112,50,123,50,15);']